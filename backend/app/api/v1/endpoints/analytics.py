@@ -4,18 +4,27 @@ Analytics and Dashboard Endpoints
 
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, desc
-from typing import List, Optional
+from sqlalchemy import select, func, and_, desc, cast, literal_column, DateTime
+from typing import List, Literal, Optional
 from datetime import datetime, timedelta
+import math
+
+import numpy as np
 
 from app.core.database import get_db
 from app.core.security import get_current_user
-from app.models import Feedback
-from app.schemas import DashboardStats, SentimentTrend, TopicDistribution
+from app.models import Feedback, FeedbackDailyRollup, SentimentEnum, UrgencyLevel
+from app.schemas import DashboardStats, SentimentTrend, SentimentTrendsResponse, TopicDistribution
+from app.services.cluster_store import load_clusters
 
 router = APIRouter()
 
 
+def _average(total, count) -> float:
+    """Mean from a rollup sum and count"""
+    return float(total) / count if count else 0.0
+
+
 @router.get("/dashboard", response_model=DashboardStats)
 async def get_dashboard_stats(
     days: int = Query(30, description="Number of days to analyze"),
@@ -24,140 +33,224 @@ async def get_dashboard_stats(
 ):
     """Get dashboard statistics"""
     
-    # Calculate date range
+    # Calculate date range; rollups are per day, so the window starts at midnight
     end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
+    start_day = (end_date - timedelta(days=days)).date()
+    tenant_id = current_user.get("tenant_id")
     
-    # Total feedback count
-    total_result = await db.execute(
-        select(func.count(Feedback.id)).where(
+    # Totals and distributions from the daily rollups of the window
+    totals_result = await db.execute(
+        select(
+            func.coalesce(func.sum(FeedbackDailyRollup.total_count), 0).label("analyzed_feedback"),
+            func.sum(FeedbackDailyRollup.sentiment_sum).label("sentiment_sum"),
+            func.sum(FeedbackDailyRollup.sentiment_count).label("sentiment_count"),
+            func.coalesce(func.sum(FeedbackDailyRollup.feature_request_count), 0).label("feature_requests"),
+            func.coalesce(func.sum(FeedbackDailyRollup.bug_report_count), 0).label("bug_reports"),
+            *[
+                func.coalesce(func.sum(FeedbackDailyRollup.__table__.c[f"{sentiment.value}_count"]), 0)
+                .label(f"sentiment_{sentiment.value}")
+                for sentiment in SentimentEnum
+            ],
+            *[
+                func.coalesce(func.sum(FeedbackDailyRollup.__table__.c[f"{level.value}_count"]), 0)
+                .label(f"urgency_{level.value}")
+                for level in UrgencyLevel
+            ]
+        ).where(
             and_(
-                Feedback.tenant_id == current_user.get("tenant_id"),
-                Feedback.created_at >= start_date
+                FeedbackDailyRollup.tenant_id == tenant_id,
+                FeedbackDailyRollup.day >= start_day
             )
         )
     )
-    total_feedback = total_result.scalar()
+    totals = totals_result.one()._mapping
     
-    # Average sentiment
-    avg_sentiment_result = await db.execute(
-        select(func.avg(Feedback.sentiment_score)).where(
+    # Items still waiting for analysis aren't in the rollups yet
+    pending_result = await db.execute(
+        select(func.count(Feedback.id)).where(
             and_(
-                Feedback.tenant_id == current_user.get("tenant_id"),
-                Feedback.created_at >= start_date
+                Feedback.tenant_id == tenant_id,
+                Feedback.analyzed_at.is_(None),
+                Feedback.created_at >= start_day
             )
         )
     )
-    avg_sentiment = avg_sentiment_result.scalar() or 0.0
-    
-    # Sentiment distribution
-    sentiment_dist_result = await db.execute(
-        select(
-            Feedback.sentiment,
-            func.count(Feedback.id)
-        ).where(
-            and_(
-                Feedback.tenant_id == current_user.get("tenant_id"),
-                Feedback.created_at >= start_date
-            )
-        ).group_by(Feedback.sentiment)
-    )
+    pending = pending_result.scalar()
     
     sentiment_distribution = {
-        row[0]: row[1] for row in sentiment_dist_result.all() if row[0]
+        sentiment.value: totals[f"sentiment_{sentiment.value}"]
+        for sentiment in SentimentEnum if totals[f"sentiment_{sentiment.value}"]
     }
-    
-    # Urgency distribution
-    urgency_dist_result = await db.execute(
-        select(
-            Feedback.urgency_level,
-            func.count(Feedback.id)
-        ).where(
-            and_(
-                Feedback.tenant_id == current_user.get("tenant_id"),
-                Feedback.created_at >= start_date
-            )
-        ).group_by(Feedback.urgency_level)
-    )
-    
     urgency_distribution = {
-        row[0]: row[1] for row in urgency_dist_result.all() if row[0]
+        level.value: totals[f"urgency_{level.value}"]
+        for level in UrgencyLevel if totals[f"urgency_{level.value}"]
     }
     
-    # Feature requests and bug reports
-    feature_requests_result = await db.execute(
-        select(func.count(Feedback.id)).where(
-            and_(
-                Feedback.tenant_id == current_user.get("tenant_id"),
-                Feedback.is_feature_request == True,
-                Feedback.created_at >= start_date
-            )
-        )
-    )
-    feature_requests = feature_requests_result.scalar()
+    # Sentiment trend (last 7 days)
+    trend_start = end_date.date() - timedelta(days=6)
     
-    bug_reports_result = await db.execute(
-        select(func.count(Feedback.id)).where(
+    trend_result = await db.execute(
+        select(
+            FeedbackDailyRollup.day,
+            *[
+                func.sum(FeedbackDailyRollup.__table__.c[f"{sentiment.value}_count"]).label(sentiment.value)
+                for sentiment in SentimentEnum
+            ],
+            func.sum(FeedbackDailyRollup.sentiment_sum).label("sentiment_sum"),
+            func.sum(FeedbackDailyRollup.sentiment_count).label("sentiment_count")
+        ).where(
             and_(
-                Feedback.tenant_id == current_user.get("tenant_id"),
-                Feedback.is_bug_report == True,
-                Feedback.created_at >= start_date
+                FeedbackDailyRollup.tenant_id == tenant_id,
+                FeedbackDailyRollup.day >= trend_start
             )
-        )
+        ).group_by(FeedbackDailyRollup.day)
     )
-    bug_reports = bug_reports_result.scalar()
+    trend_by_day = {row.day: row for row in trend_result.all()}
     
-    # Sentiment trend (last 7 days)
     sentiment_trend = []
     for i in range(7):
-        day = end_date - timedelta(days=i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day_start + timedelta(days=1)
-        
-        sentiment_day_result = await db.execute(
-            select(
-                Feedback.sentiment,
-                func.count(Feedback.id),
-                func.avg(Feedback.sentiment_score)
-            ).where(
-                and_(
-                    Feedback.tenant_id == current_user.get("tenant_id"),
-                    Feedback.created_at >= day_start,
-                    Feedback.created_at < day_end
-                )
-            ).group_by(Feedback.sentiment)
-        )
+        date = trend_start + timedelta(days=i)
+        row = trend_by_day.get(date)
         
-        day_data = {"date": day.strftime("%Y-%m-%d"), "positive": 0, "negative": 0, "neutral": 0, "avg_score": 0.0}
-        
-        for row in sentiment_day_result.all():
-            if row[0]:
-                day_data[row[0]] = row[1]
-                day_data["avg_score"] = row[2] or 0.0
-        
-        sentiment_trend.append(day_data)
+        sentiment_trend.append({
+            "date": date.strftime("%Y-%m-%d"),
+            "positive": row.positive if row else 0,
+            "negative": row.negative if row else 0,
+            "neutral": row.neutral if row else 0,
+            "avg_score": _average(row.sentiment_sum, row.sentiment_count) if row else 0.0
+        })
     
     return {
-        "total_feedback": total_feedback,
-        "avg_sentiment": float(avg_sentiment),
+        "total_feedback": totals["analyzed_feedback"] + pending,
+        "avg_sentiment": _average(totals["sentiment_sum"], totals["sentiment_count"]),
         "sentiment_distribution": sentiment_distribution,
         "urgency_distribution": urgency_distribution,
         "top_topics": [],  # Implemented separately
-        "sentiment_trend": list(reversed(sentiment_trend)),
-        "feature_requests": feature_requests,
-        "bug_reports": bug_reports
+        "sentiment_trend": sentiment_trend,
+        "feature_requests": totals["feature_requests"],
+        "bug_reports": totals["bug_reports"]
     }
 
 
-@router.get("/trends/sentiment")
+@router.get("/trends/sentiment", response_model=SentimentTrendsResponse)
 async def get_sentiment_trends(
-    days: int = Query(30),
+    days: int = Query(30, ge=1, le=3650),
+    granularity: Literal["hour", "day", "week", "month"] = Query("day"),
+    max_points: int = Query(200, ge=2, le=2000, description="Adjacent buckets are merged beyond this"),
+    smoothing_window: int = Query(7, ge=1, le=100, description="Points in the moving average; 1 disables it"),
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get detailed sentiment trends"""
-    # Implementation similar to dashboard but more detailed
-    return {"status": "trends"}
+    """Get sentiment trends bucketed by hour, day, week or month"""
+    
+    end_date = datetime.utcnow()
+    start_date = _bucket_start(end_date - timedelta(days=days), granularity)
+    tenant_id = current_user.get("tenant_id")
+    
+    if granularity == "hour":
+        # Finer than the rollups; scan the tenant's date range directly
+        bucket = func.date_trunc(literal_column("'hour'"), Feedback.created_at).label("bucket")
+        columns = [
+            *[
+                func.count(Feedback.id).filter(Feedback.sentiment == sentiment).label(sentiment.value)
+                for sentiment in SentimentEnum
+            ],
+            func.sum(Feedback.sentiment_score).label("sentiment_sum"),
+            func.count(Feedback.sentiment_score).label("sentiment_count")
+        ]
+        condition = and_(
+            Feedback.tenant_id == tenant_id,
+            Feedback.analyzed_at.isnot(None),
+            Feedback.created_at >= start_date
+        )
+    else:
+        # Cast so date_trunc returns a naive timestamp rather than timestamptz
+        day = cast(FeedbackDailyRollup.day, DateTime)
+        bucket = func.date_trunc(literal_column(f"'{granularity}'"), day).label("bucket")
+        columns = [
+            *[
+                func.sum(FeedbackDailyRollup.__table__.c[f"{sentiment.value}_count"]).label(sentiment.value)
+                for sentiment in SentimentEnum
+            ],
+            func.sum(FeedbackDailyRollup.sentiment_sum).label("sentiment_sum"),
+            func.sum(FeedbackDailyRollup.sentiment_count).label("sentiment_count")
+        ]
+        condition = and_(
+            FeedbackDailyRollup.tenant_id == tenant_id,
+            FeedbackDailyRollup.day >= start_date.date()
+        )
+    
+    result = await db.execute(select(bucket, *columns).where(condition).group_by(bucket))
+    rows = {row.bucket: row for row in result.all()}
+    
+    # Dense series with empty buckets filled in: positive, negative, neutral, score sum, score count
+    starts = _bucket_starts(start_date, end_date, granularity)
+    series = np.zeros((len(starts), 5))
+    for i, bucket_start in enumerate(starts):
+        row = rows.get(bucket_start)
+        if row:
+            series[i] = [row.positive, row.negative, row.neutral, row.sentiment_sum or 0.0, row.sentiment_count]
+    
+    # Downsample by summing runs of adjacent buckets
+    buckets_per_point = max(1, math.ceil(len(starts) / max_points))
+    offsets = np.arange(0, len(starts), buckets_per_point)
+    series = np.add.reduceat(series, offsets, axis=0)
+    starts = [starts[i] for i in offsets]
+    
+    sums, counts = series[:, 3], series[:, 4]
+    window = np.ones(smoothing_window)
+    rolling_sums = np.convolve(sums, window)[:len(sums)]
+    rolling_counts = np.convolve(counts, window)[:len(counts)]
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_scores = np.where(counts > 0, sums / counts, 0.0)
+        moving_avgs = np.where(rolling_counts > 0, rolling_sums / rolling_counts, 0.0)
+    
+    date_format = "%Y-%m-%dT%H:00" if granularity == "hour" else "%Y-%m-%d"
+    points = [
+        {
+            "date": bucket_start.strftime(date_format),
+            "positive": int(values[0]),
+            "negative": int(values[1]),
+            "neutral": int(values[2]),
+            "total": int(values[:3].sum()),
+            "avg_score": float(avg_score),
+            "moving_avg": float(moving_avg)
+        }
+        for bucket_start, values, avg_score, moving_avg in zip(starts, series, avg_scores, moving_avgs)
+    ]
+    
+    return {
+        "granularity": granularity,
+        "buckets_per_point": buckets_per_point,
+        "points": points
+    }
+
+
+def _bucket_start(moment: datetime, granularity: str) -> datetime:
+    """Start of the bucket containing `moment`, matching Postgres date_trunc"""
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "week":
+        return start - timedelta(days=start.weekday())  # ISO weeks start on Monday
+    if granularity == "month":
+        return start.replace(day=1)
+    return start
+
+
+def _bucket_starts(start: datetime, end: datetime, granularity: str) -> List[datetime]:
+    """Every bucket start from `start` up to and including the bucket of `end`"""
+    starts = []
+    current = start
+    while current <= end:
+        starts.append(current)
+        if granularity == "month":
+            current = current.replace(year=current.year + current.month // 12, month=current.month % 12 + 1)
+        else:
+            current += {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}[granularity]
+    return starts
 
 
 @router.get("/topics/distribution")
@@ -166,5 +259,19 @@ async def get_topic_distribution(
     current_user: dict = Depends(get_current_user)
 ):
     """Get topic distribution statistics"""
-    # Implementation for topic analysis
-    return {"topics": []}
+    # Sizes, sentiment and trend are kept on the cluster rows as they're written
+    clusters = await load_clusters(db, current_user.get("tenant_id"))
+    total = sum(cluster.size or 0 for cluster in clusters)
+    
+    topics = [
+        TopicDistribution(
+            topic=cluster.name or f"cluster_{cluster.label}",
+            count=cluster.size or 0,
+            percentage=round(100.0 * (cluster.size or 0) / total, 2) if total else 0.0,
+            avg_sentiment=cluster.avg_sentiment or 0.0,
+            trend=cluster.trend
+        )
+        for cluster in sorted(clusters, key=lambda cluster: cluster.size or 0, reverse=True)
+    ]
+    
+    return {"topics": topics}
@@ -2,74 +2,112 @@
 Clustering API endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select, func, text
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from starlette.concurrency import run_in_threadpool
+from celery.result import AsyncResult
 from typing import List, Dict, Any
+from datetime import timedelta
+import json
 
+from app.core.cache import get_redis
+from app.core.config import settings
 from app.core.database import get_db
-from app.models import Feedback
-from app.services.clustering_service import get_clustering_service
+from app.models import Feedback, FeedbackDailyRollup
+from app.services.cluster_store import (
+    MIN_FEEDBACK_FOR_CLUSTERING,
+    clustering_cache_key,
+    embedding_set_version,
+    load_clusters
+)
+from app.services.clustering_service import VectorIndex, get_clustering_service
+from app.services.embedding_loader import load_embeddings
 from app.core.security import get_current_user
+from app.tasks.analysis_tasks import celery_app, run_clustering_task
 
 router = APIRouter()
 
 
 @router.post("/run", response_model=Dict[str, Any])
 async def run_clustering(
+    response: Response,
     n_clusters: int = None,
+    warm_start: bool = True,
     current_user: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Run clustering on all analyzed feedback
+    
+    Clustering runs as a background job; poll /clustering/jobs/{job_id}.
+    If no feedback was analyzed or deleted since the last run with the
+    same parameters, the cached result is returned immediately.
+    By default the previous run's centroids seed the new fit; pass
+    warm_start=false to re-select the number of clusters from scratch.
     """
-    # Get all analyzed feedback with embeddings
-    query = select(Feedback).where(
-        Feedback.tenant_id == current_user.get("tenant_id"),
-        Feedback.analyzed_at.isnot(None),
-        Feedback.embedding.isnot(None)
-    )
-    result = await db.execute(query)
-    feedbacks = result.scalars().all()
+    tenant_id = str(current_user.get("tenant_id"))
+    count, version = await embedding_set_version(db, tenant_id)
     
-    if len(feedbacks) < 5:
+    if count < MIN_FEEDBACK_FOR_CLUSTERING:
         raise HTTPException(
             status_code=400,
-            detail="Not enough analyzed feedback for clustering (minimum 5 required)"
+            detail=f"Not enough analyzed feedback for clustering (minimum {MIN_FEEDBACK_FOR_CLUSTERING} required)"
         )
     
-    # Extract embeddings and texts
-    embeddings = [f.embedding for f in feedbacks]
-    texts = [f.text for f in feedbacks]
+    redis = get_redis()
+    params = {"n_clusters": n_clusters, "warm_start": warm_start}
     
-    # Run clustering
-    clustering_service = get_clustering_service()
-    result = clustering_service.cluster_feedback(
-        embeddings=embeddings,
-        texts=texts,
-        n_clusters=n_clusters
-    )
+    cached = await redis.get(clustering_cache_key(tenant_id))
+    if cached:
+        entry = json.loads(cached)
+        if entry["version"] == version and entry["params"] == params:
+            return {"success": True, "status": "completed", "cached": True, **entry["result"]}
     
-    # Update feedback with cluster assignments
-    if result.get("labels"):
-        for i, feedback in enumerate(feedbacks):
-            cluster_id = int(result["labels"][i])  # Convert numpy.int64 to Python int
-            # Store cluster ID in topics field for now
-            # (We could add a dedicated cluster_id field later)
-            if feedback.topics is None:
-                feedback.topics = []
-            feedback.topics = [f"cluster_{cluster_id}"]
-        
-        await db.commit()
-    
-    # Convert numpy types to Python types for JSON serialization
-    return {
-        "success": True,
-        "items_clustered": len(feedbacks),
-        "clusters_created": int(result.get("n_clusters", 0)),
-        "clusters": result.get("clusters", [])
-    }
+    # Reuse a job that is already working on the same input
+    job_key = f"clustering:job:{tenant_id}:{version}:{n_clusters}:{warm_start}"
+    job_id = await redis.get(job_key)
+    if job_id:
+        job_id = job_id.decode()
+        state = await run_in_threadpool(lambda: AsyncResult(job_id, app=celery_app).state)
+        if state in ("FAILURE", "REVOKED"):
+            job_id = None
+    
+    if not job_id:
+        task = run_clustering_task.delay(tenant_id, n_clusters, warm_start, version)
+        job_id = task.id
+        await redis.set(job_key, job_id, ex=settings.CLUSTERING_JOB_TTL_SECONDS)
+        await redis.set(f"clustering:job_tenant:{job_id}", tenant_id, ex=settings.CLUSTERING_JOB_TTL_SECONDS)
+    
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {"success": True, "status": "queued", "cached": False, "job_id": job_id}
+
+
+@router.get("/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_clustering_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get status, progress and result of a clustering job
+    """
+    owner = await get_redis().get(f"clustering:job_tenant:{job_id}")
+    if owner is None or owner.decode() != str(current_user.get("tenant_id")):
+        raise HTTPException(status_code=404, detail="Clustering job not found")
+    
+    job = AsyncResult(job_id, app=celery_app)
+    state, info = await run_in_threadpool(lambda: (job.state, job.info))
+    
+    body = {"job_id": job_id, "status": state.lower(), "progress": 0.0}
+    if state == "PROGRESS":
+        body.update(stage=info.get("stage"), progress=info.get("progress", 0.0))
+    elif state == "SUCCESS":
+        body.update(progress=1.0, result=info)
+    elif state == "FAILURE":
+        body.update(error=str(info))
+    
+    return body
 
 
 @router.get("/info", response_model=Dict[str, Any])
@@ -80,24 +118,19 @@ async def get_clustering_info(
     """
     Get current clustering information
     """
-    # Get all analyzed feedback
-    query = select(Feedback).where(
-        Feedback.tenant_id == current_user.get("tenant_id"),
-        Feedback.analyzed_at.isnot(None)
-    )
-    result = await db.execute(query)
-    feedbacks = result.scalars().all()
+    tenant_id = current_user.get("tenant_id")
     
-    # Count feedback per cluster
-    cluster_counts = {}
-    for feedback in feedbacks:
-        if feedback.topics:
-            for topic in feedback.topics:
-                if topic.startswith("cluster_"):
-                    cluster_counts[topic] = cluster_counts.get(topic, 0) + 1
+    # Analyzed totals come from the daily rollups, memberships from the cluster rows
+    total_feedback = await db.scalar(
+        select(func.coalesce(func.sum(FeedbackDailyRollup.total_count), 0)).where(
+            FeedbackDailyRollup.tenant_id == tenant_id
+        )
+    )
+    clusters = await load_clusters(db, tenant_id)
+    cluster_counts = {f"cluster_{cluster.label}": cluster.size or 0 for cluster in clusters}
     
     return {
-        "total_feedback": len(feedbacks),
+        "total_feedback": total_feedback,
         "clustered_feedback": sum(cluster_counts.values()),
         "clusters": cluster_counts
     }
@@ -114,7 +147,9 @@ async def find_similar_feedback(
     Find similar feedback items
     """
     # Get the target feedback
-    query = select(Feedback).where(
+    query = select(Feedback).options(
+        load_only(Feedback.id, Feedback.tenant_id, Feedback.embedding)
+    ).where(
         Feedback.id == feedback_id,
         Feedback.tenant_id == current_user.get("tenant_id")
     )
@@ -124,44 +159,120 @@ async def find_similar_feedback(
     if not target_feedback:
         raise HTTPException(status_code=404, detail="Feedback not found")
     
-    if not target_feedback.embedding:
+    if target_feedback.embedding is None:
         raise HTTPException(
             status_code=400,
             detail="Target feedback has not been analyzed yet"
         )
     
-    # Get all other analyzed feedback
-    query = select(Feedback).where(
+    if settings.VECTOR_SEARCH_BACKEND == "memory":
+        return await _find_similar_in_memory(db, target_feedback, top_k)
+    
+    # Nearest neighbours by cosine distance, served from the HNSW index
+    await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(settings.PGVECTOR_EF_SEARCH)}"))
+    
+    distance = Feedback.embedding.cosine_distance(target_feedback.embedding)
+    query = select(
+        Feedback.id,
+        Feedback.text,
+        Feedback.sentiment,
+        Feedback.customer_name,
+        distance.label("distance")
+    ).where(
         Feedback.tenant_id == current_user.get("tenant_id"),
-        Feedback.analyzed_at.isnot(None),
         Feedback.embedding.isnot(None),
         Feedback.id != feedback_id
-    )
-    result = await db.execute(query)
-    all_feedbacks = result.scalars().all()
+    ).order_by(distance).limit(top_k)
+    rows = (await db.execute(query)).all()
+    
+    if len(rows) < top_k:
+        # The index scan stops after ef_search candidates from all tenants and
+        # the tenant filter applies afterwards, so small tenants can come back
+        # short; repeat as an exact scan
+        await db.execute(text("SET LOCAL enable_indexscan = off"))
+        rows = (await db.execute(query)).all()
+    
+    # Build response
+    similar_items = []
+    for row in rows:
+        similar_items.append({
+            "id": str(row.id),
+            "text": row.text,
+            "sentiment": row.sentiment,
+            "similarity": 1.0 - float(row.distance),
+            "customer_name": row.customer_name
+        })
+    
+    return similar_items
+
+
+async def _refresh_vector_index(db: AsyncSession, tenant_id) -> VectorIndex:
+    """
+    Bring the tenant's in-process vector index up to date
     
-    if not all_feedbacks:
+    The first call loads every embedding of the tenant; later calls only
+    read rows analyzed since the last refresh, re-reading a short lag
+    window to catch transactions that committed late.
+    """
+    index = get_clustering_service().vector_index
+    
+    where = []
+    watermark = index.watermark(tenant_id)
+    if watermark is not None:
+        lag = timedelta(seconds=settings.VECTOR_INDEX_REFRESH_LAG_SECONDS)
+        where.append(Feedback.analyzed_at > watermark - lag)
+    
+    rows, embeddings = await load_embeddings(db, tenant_id, columns=[Feedback.analyzed_at], where=where)
+    
+    if rows:
+        index.upsert(
+            tenant_id,
+            [row.id for row in rows],
+            embeddings,
+            watermark=max((row.analyzed_at for row in rows if row.analyzed_at), default=None)
+        )
+    
+    return index
+
+
+async def _find_similar_in_memory(db: AsyncSession, target_feedback: Feedback, top_k: int) -> List[Dict[str, Any]]:
+    """Similar feedback from the in-process index, for deployments without pgvector"""
+    tenant_id = target_feedback.tenant_id
+    index = await _refresh_vector_index(db, tenant_id)
+    
+    matches = index.search(
+        tenant_id,
+        [target_feedback.embedding],
+        top_k,
+        exclude=[str(target_feedback.id)]
+    )[0]
+    if not matches:
         return []
     
-    # Find similar items
-    clustering_service = get_clustering_service()
-    embeddings = [f.embedding for f in all_feedbacks]
-    similar_indices = clustering_service.find_similar_feedback(
-        query_embedding=target_feedback.embedding,
-        all_embeddings=embeddings,
-        top_k=min(top_k, len(all_feedbacks))
+    result = await db.execute(
+        select(Feedback.id, Feedback.text, Feedback.sentiment, Feedback.customer_name).where(
+            Feedback.tenant_id == tenant_id,
+            Feedback.id.in_([feedback_id for feedback_id, _ in matches])
+        )
     )
+    rows = {str(row.id): row for row in result.all()}
+    
+    # Rows deleted through another process are still indexed here
+    stale_ids = [feedback_id for feedback_id, _ in matches if feedback_id not in rows]
+    if stale_ids:
+        index.remove(tenant_id, stale_ids)
     
-    # Build response
     similar_items = []
-    for idx, similarity in similar_indices:
-        feedback = all_feedbacks[idx]
+    for feedback_id, similarity in matches:
+        row = rows.get(feedback_id)
+        if row is None:
+            continue
         similar_items.append({
-            "id": str(feedback.id),
-            "text": feedback.text,
-            "sentiment": feedback.sentiment,
+            "id": feedback_id,
+            "text": row.text,
+            "sentiment": row.sentiment,
             "similarity": similarity,
-            "customer_name": feedback.customer_name
+            "customer_name": row.customer_name
         })
     
     return similar_items
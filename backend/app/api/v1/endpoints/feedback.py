@@ -2,35 +2,43 @@
 Feedback Management Endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Response, status, UploadFile, File
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func
+from sqlalchemy import select, desc, func, tuple_
+from sqlalchemy.orm import load_only
 from typing import List, Optional
 from uuid import UUID
-import pandas as pd
-import io
+from datetime import datetime
+import base64
 import json
 
+from app.core.bulk_insert import copy_feedback_rows
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_current_user
-from app.models import Feedback, User
+from app.models import Feedback, FeedbackClusterAssociation, User
 from app.schemas import (
     FeedbackCreate,
     FeedbackResponse,
     FeedbackUpdate,
     BatchUploadResponse
 )
-from app.services.ai_analyzer import get_ai_analyzer
+from app.services.analytics_rollup import RollupDelta, analyzed_values
+from app.services.cluster_store import lock_clusters, remove_cluster_member
+from app.services.clustering_service import get_clustering_service
+from app.services.feedback_ingestion import iter_feedback_chunks
 from app.services.s3_service import s3_service
-from app.tasks.analysis_tasks import analyze_feedback_task
+from app.tasks.analysis_tasks import analyze_feedback_task, analyze_feedback_batch_task
 
 router = APIRouter()
 
+# Feedback columns serialized by FeedbackResponse
+LIST_COLUMNS = [getattr(Feedback, name) for name in FeedbackResponse.model_fields]
+
 
 @router.post("/", response_model=FeedbackResponse, status_code=status.HTTP_201_CREATED)
 async def create_feedback(
     feedback_data: FeedbackCreate,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
@@ -52,8 +60,8 @@ async def create_feedback(
     await db.commit()
     await db.refresh(db_feedback)
     
-    # Schedule background analysis
-    background_tasks.add_task(analyze_feedback_task, str(db_feedback.id))
+    # Queue analysis on the Celery workers
+    analyze_feedback_task.delay(str(db_feedback.id))
     
     return db_feedback
 
@@ -61,11 +69,10 @@ async def create_feedback(
 @router.post("/bulk", response_model=BatchUploadResponse)
 async def bulk_upload_feedback(
     file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Bulk upload feedback from CSV/Excel file (Admin and Analyst only)"""
+    """Bulk upload feedback from CSV/JSON/Excel file (Admin and Analyst only)"""
     
     # Check if user has permission to upload (admin or analyst)
     user_role = current_user.get("role")
@@ -76,23 +83,21 @@ async def bulk_upload_feedback(
         )
     
     try:
-        # Read file content
-        contents = await file.read()
-        
         # Store file in S3 if enabled (AWS Free Tier: 5GB storage)
+        # Streamed from the spooled upload file rather than copied into memory
         s3_key = None
         if s3_service.enabled:
             try:
-                file_obj = io.BytesIO(contents)
+                file.file.seek(0)
                 s3_result = await s3_service.upload_file_async(
-                    file_obj,
+                    file.file,
                     file.filename,
                     current_user.get("tenant_id"),
                     prefix="bulk_uploads",
                     content_type=file.content_type,
                     metadata={
                         "uploaded_by": current_user.get("email", ""),
-                        "upload_date": pd.Timestamp.now().isoformat()
+                        "upload_date": datetime.now().isoformat()
                     }
                 )
                 s3_key = s3_result['key']
@@ -100,53 +105,42 @@ async def bulk_upload_feedback(
                 # Log but don't fail - continue with processing
                 print(f"S3 upload failed: {s3_error}")
         
-        # Parse based on file type
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(contents))
-        elif file.filename.endswith('.json'):
-            df = pd.read_json(io.BytesIO(contents))
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Unsupported file format. Use CSV, Excel, or JSON."
-            )
-        
-        # Validate required columns
-        required_columns = ['text']
-        if not all(col in df.columns for col in required_columns):
+        # Parse and insert in bounded chunks, one COPY per chunk
+        file.file.seek(0)
+        feedback_ids = []
+        try:
+            for chunk in iter_feedback_chunks(file.file, file.filename, settings.BULK_UPLOAD_CHUNK_SIZE):
+                rows = []
+                for row in chunk:
+                    feedback_metadata = dict(row)
+                    if s3_key:
+                        feedback_metadata['s3_key'] = s3_key  # Link to original file
+                    
+                    rows.append({
+                        "tenant_id": current_user.get("tenant_id"),
+                        "text": row['text'],
+                        "customer_id": row.get('customer_id'),
+                        "customer_name": row.get('customer_name'),
+                        "customer_email": row.get('customer_email'),
+                        "source": row.get('source') or 'bulk_upload',
+                        "channel": row.get('channel'),
+                        "feedback_metadata": feedback_metadata
+                    })
+                
+                inserted_ids = await copy_feedback_rows(db, rows)
+                feedback_ids.extend(str(feedback_id) for feedback_id in inserted_ids)
+        except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Missing required columns. Need: {required_columns}"
+                detail=str(e)
             )
         
-        # Create feedback records
-        feedback_ids = []
-        for _, row in df.iterrows():
-            feedback_metadata = row.to_dict()
-            if s3_key:
-                feedback_metadata['s3_key'] = s3_key  # Link to original file
-            
-            db_feedback = Feedback(
-                tenant_id=current_user.get("tenant_id"),
-                text=row['text'],
-                customer_id=row.get('customer_id'),
-                customer_name=row.get('customer_name'),
-                customer_email=row.get('customer_email'),
-                source=row.get('source', 'bulk_upload'),
-                channel=row.get('channel'),
-                metadata=feedback_metadata
-            )
-            db.add(db_feedback)
-            await db.flush()
-            feedback_ids.append(str(db_feedback.id))
-        
         await db.commit()
         
-        # Schedule background analysis for all feedback
-        for feedback_id in feedback_ids:
-            background_tasks.add_task(analyze_feedback_task, feedback_id)
+        # Queue batched analysis on the Celery workers, one job per chunk
+        chunk_size = settings.ANALYSIS_TASK_CHUNK_SIZE
+        for start in range(0, len(feedback_ids), chunk_size):
+            analyze_feedback_batch_task.delay(feedback_ids[start:start + chunk_size])
         
         return {
             "job_id": f"bulk_{current_user.get('sub')}_{len(feedback_ids)}",
@@ -156,6 +150,8 @@ async def bulk_upload_feedback(
             "s3_stored": s3_key is not None
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -163,19 +159,48 @@ async def bulk_upload_feedback(
         )
 
 
+def _encode_cursor(feedback: Feedback) -> str:
+    """Opaque cursor pointing just after `feedback` in list order"""
+    position = json.dumps([feedback.created_at.isoformat(), str(feedback.id)])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, feedback_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), UUID(feedback_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
 @router.get("/", response_model=List[FeedbackResponse])
 async def list_feedback(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
+    cursor: Optional[str] = None,
     sentiment: Optional[str] = None,
     urgency_level: Optional[str] = None,
     status: Optional[str] = None,
+    topic: Optional[str] = None,
+    keyword: Optional[str] = None,
+    competitor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """List feedback with filters"""
+    """
+    List feedback with filters
     
-    query = select(Feedback).where(
+    Pass the X-Next-Cursor header of a page as `cursor` to fetch the next
+    one; the header is absent on the last page. `skip` still works but
+    gets slower on deep pages.
+    """
+    
+    # Only the columns the response shows
+    query = select(Feedback).options(load_only(*LIST_COLUMNS)).where(
         Feedback.tenant_id == current_user.get("tenant_id")
     )
     
@@ -187,12 +212,29 @@ async def list_feedback(
     if status:
         query = query.where(Feedback.status == status)
     
-    # Order by created date (newest first)
-    query = query.order_by(desc(Feedback.created_at)).offset(skip).limit(limit)
+    # Array containment (@>) so the GIN indexes apply
+    if topic:
+        query = query.where(Feedback.topics.contains([topic]))
+    if keyword:
+        query = query.where(Feedback.keywords.contains([keyword]))
+    if competitor:
+        query = query.where(Feedback.competitor_names.contains([competitor]))
+    
+    # Order by created date (newest first), id breaks ties so the order is total
+    query = query.order_by(desc(Feedback.created_at), desc(Feedback.id))
+    if cursor:
+        query = query.where(tuple_(Feedback.created_at, Feedback.id) < _decode_cursor(cursor))
+    elif skip:
+        query = query.offset(skip)
     
-    result = await db.execute(query)
+    # One extra row tells whether there is a next page
+    result = await db.execute(query.limit(limit + 1))
     feedbacks = result.scalars().all()
     
+    if len(feedbacks) > limit:
+        feedbacks = feedbacks[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(feedbacks[-1])
+    
     return feedbacks
 
 
@@ -263,6 +305,9 @@ async def delete_feedback(
 ):
     """Delete feedback"""
     
+    # Cluster rows first, the lock order of every writer of cluster counters
+    await lock_clusters(db, [current_user.get("tenant_id")])
+    
     result = await db.execute(
         select(Feedback).where(
             Feedback.id == feedback_id,
@@ -277,16 +322,32 @@ async def delete_feedback(
             detail="Feedback not found"
         )
     
+    # Take the item out of the daily rollups in the same transaction
+    rollup = RollupDelta()
+    rollup.add(feedback, analyzed_values(feedback), sign=-1)
+    await rollup.apply(db)
+    
+    # The membership row goes with the feedback; take the item out of its cluster too
+    cluster_id = await db.scalar(
+        select(FeedbackClusterAssociation.cluster_id).where(
+            FeedbackClusterAssociation.feedback_id == feedback.id
+        )
+    )
+    if cluster_id is not None:
+        await remove_cluster_member(db, cluster_id, feedback.sentiment_score)
+    
     await db.delete(feedback)
     await db.commit()
     
+    # Keep the in-process similarity index consistent
+    get_clustering_service().vector_index.remove(feedback.tenant_id, [str(feedback_id)])
+    
     return None
 
 
 @router.post("/{feedback_id}/analyze", response_model=FeedbackResponse)
 async def reanalyze_feedback(
     feedback_id: UUID,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
@@ -306,7 +367,7 @@ async def reanalyze_feedback(
             detail="Feedback not found"
         )
     
-    # Schedule re-analysis
-    background_tasks.add_task(analyze_feedback_task, str(feedback_id))
+    # Queue re-analysis on the Celery workers
+    analyze_feedback_task.delay(str(feedback_id))
     
     return feedback
@@ -0,0 +1,71 @@
+"""
+Bulk Write Helpers using PostgreSQL COPY
+"""
+
+from sqlalchemy import JSON
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List
+import copy
+import json
+import logging
+import uuid
+
+from app.models import Feedback
+
+logger = logging.getLogger(__name__)
+
+
+async def copy_feedback_rows(session: AsyncSession, rows: List[Dict[str, Any]]) -> List[uuid.UUID]:
+    """
+    Stream feedback rows into the feedbacks table with COPY
+
+    Used by bulk upload and integration sync jobs. Rows are dicts keyed by
+    Feedback column names. COPY bypasses the ORM, so ids and column defaults
+    are filled in here. Runs on the session's connection, inside its
+    transaction.
+
+    Returns:
+        Generated feedback ids, in row order
+    """
+    if not rows:
+        return []
+
+    table = Feedback.__table__
+    provided = set().union(*(row.keys() for row in rows))
+    columns = [
+        column for column in table.columns
+        if column.key in provided or column.default is not None
+    ]
+    id_index = columns.index(table.c.id)
+
+    feedback_ids = []
+    records = []
+    for row in rows:
+        record = []
+        for column in columns:
+            if column.key in row:
+                value = row[column.key]
+            elif column.default.is_callable:
+                value = column.default.arg(None)
+            else:
+                value = copy.copy(column.default.arg)
+
+            if isinstance(column.type, JSON) and value is not None:
+                # asyncpg's json codec under SQLAlchemy takes pre-encoded text
+                value = json.dumps(value, default=str)
+
+            record.append(value)
+
+        feedback_ids.append(record[id_index])
+        records.append(tuple(record))
+
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        table.name,
+        records=records,
+        columns=[column.name for column in columns]
+    )
+
+    logger.info(f"Copied {len(records)} rows into {table.name}")
+    return feedback_ids
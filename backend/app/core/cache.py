@@ -0,0 +1,27 @@
+"""
+Redis Connections for Caching and Job Bookkeeping
+"""
+
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+_redis = None
+_sync_redis = None
+
+
+def get_redis() -> aioredis.Redis:
+    """Get or create the async Redis client used by API handlers"""
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+def get_sync_redis() -> redis.Redis:
+    """Get or create the Redis client used by Celery tasks and other sync code"""
+    global _sync_redis
+    if _sync_redis is None:
+        _sync_redis = redis.Redis.from_url(settings.REDIS_URL)
+    return _sync_redis
@@ -47,6 +47,7 @@ class Settings(BaseSettings):
     # Celery
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
+    CELERY_PRELOAD_MODELS: bool = True  # Load models in the worker parent so forked children share them
     
     # AI/ML API Keys (Optional)
     OPENAI_API_KEY: Optional[str] = None
@@ -59,6 +60,45 @@ class Settings(BaseSettings):
     SENTIMENT_MODEL: str = "cardiffnlp/twitter-roberta-base-sentiment-latest"
     EMOTION_MODEL: str = "j-hartmann/emotion-english-distilroberta-base"
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_DIM: int = 384  # Must match EMBEDDING_MODEL output size
+    
+    # Inference backend: "torch" (eager), "onnx" or "torchscript"; the latter two need
+    # `python -m app.services.inference_backends export --backend <name>` first
+    INFERENCE_BACKEND: str = "torch"
+    INFERENCE_MODEL_DIR: str = "./models"
+    INFERENCE_NUM_THREADS: int = 0  # Intra-op threads per model; 0 leaves the runtime default
+    INFERENCE_EXPORT_TOLERANCE: float = 1e-3  # Max probability diff / cosine drift vs eager
+    
+    # Dynamic INT8 quantization of the eager models' linear layers (CPU only); takes
+    # effect once `python -m app.services.inference_backends quantize --sample <csv>` passes
+    INFERENCE_QUANTIZE: bool = False
+    INFERENCE_QUANTIZE_MIN_AGREEMENT: float = 0.97  # fp32 vs int8 label agreement, per classifier
+    INFERENCE_QUANTIZE_MIN_COSINE: float = 0.98  # Lowest fp32 vs int8 embedding cosine similarity
+    
+    # Standalone model server (`python -m app.services.inference_server`); when set, API
+    # and worker processes send model calls to it instead of loading the models
+    INFERENCE_SERVER_SOCKET: Optional[str] = None
+    INFERENCE_SERVER_TIMEOUT: float = 30.0  # Seconds to wait for one request
+    
+    # Vector search: "pgvector" (HNSW index in Postgres) or "memory" (in-process index)
+    VECTOR_SEARCH_BACKEND: str = "pgvector"
+    PGVECTOR_EF_SEARCH: int = 100  # HNSW candidate list size per query
+    VECTOR_INDEX_REFRESH_LAG_SECONDS: int = 300  # Overlap re-read on refresh for late commits
+    EMBEDDING_STORAGE_DTYPE: str = "float32"  # or "float16": halfvec with pgvector, packed bytea otherwise
+    EMBEDDING_LOAD_CHUNK_SIZE: int = 2000  # Rows per server-side cursor fetch when loading embeddings
+    
+    # Batched inference
+    ANALYSIS_BATCH_SIZE: int = 32  # Texts per model forward pass
+    # Dynamic batching in the inference server, which coalesces its concurrent callers
+    DYNAMIC_BATCH_MAX_WAIT_MS: int = 10  # Max time a text waits for its bucket to fill
+    DYNAMIC_BATCH_LENGTH_BUCKETS: List[int] = [16, 32, 64, 128, 256, 512]  # Token length bounds
+    ANALYSIS_TASK_CHUNK_SIZE: int = 500  # Feedback rows per batch analysis job
+    
+    # Analysis result cache, keyed by normalized text and model names
+    ANALYSIS_CACHE_ENABLED: bool = True
+    ANALYSIS_CACHE_LRU_SIZE: int = 10000  # Entries kept in each process
+    ANALYSIS_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # Redis tier budget before eviction
+    ANALYSIS_CACHE_VERSION: str = "1"  # Bump to invalidate every cached result
     
     # Authentication
     JWT_SECRET_KEY: str
@@ -68,7 +108,8 @@ class Settings(BaseSettings):
     
     # File Upload
     MAX_UPLOAD_SIZE: int = 52428800  # 50MB
-    ALLOWED_EXTENSIONS: List[str] = ["csv", "json", "xlsx", "xls", "txt"]
+    ALLOWED_EXTENSIONS: List[str] = ["csv", "json", "jsonl", "xlsx", "xls", "txt"]
+    BULK_UPLOAD_CHUNK_SIZE: int = 1000  # Rows parsed and inserted per chunk
     UPLOAD_DIR: str = "uploads"
     
     # Rate Limiting
@@ -78,6 +119,19 @@ class Settings(BaseSettings):
     # Analytics
     MIN_CLUSTER_SIZE: int = 5
     MAX_CLUSTERS: int = 20
+    CLUSTERING_BATCH_SIZE: int = 1024  # MiniBatchKMeans batch size
+    CLUSTERING_DRIFT_THRESHOLD: float = 0.2  # Outlier share of new items that triggers re-clustering
+    CLUSTERING_DRIFT_MIN_ITEMS: int = 50  # New items needed before drift is evaluated
+    CLUSTERING_REFIT_LOCK_SECONDS: int = 3600  # A drift re-fit is queued at most once per tenant until it runs
+    CLUSTERING_SCHEDULE_HOURS: int = 24  # Interval of scheduled warm-start re-clustering
+    CLUSTER_SELECTION_METHOD: str = "silhouette"  # or "kneedle"
+    CLUSTER_SELECTION_SAMPLE_SIZE: int = 5000  # Embeddings used to fit each candidate k
+    CLUSTER_SELECTION_SILHOUETTE_SAMPLE: int = 2000  # Embeddings used for silhouette scoring
+    CLUSTER_SELECTION_TIME_BUDGET: float = 10.0  # Seconds before no new candidates are started
+    CLUSTER_SELECTION_N_JOBS: int = 4  # Candidates fitted in parallel
+    CLUSTERING_CACHE_TTL_SECONDS: int = 86400  # Cached /clustering/run result per tenant
+    CLUSTERING_JOB_TTL_SECONDS: int = 3600  # How long job ids stay queryable
+    CLUSTER_TREND_DAYS: int = 7  # Window compared against the one before it for topic trends
     SENTIMENT_THRESHOLD: float = 0.6
     URGENCY_HIGH_THRESHOLD: int = 7
     URGENCY_MEDIUM_THRESHOLD: int = 4
@@ -0,0 +1,67 @@
+"""
+Compact Embedding Column Types
+Stores embeddings as float32/float16 instead of Postgres double precision arrays
+"""
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+from pgvector.sqlalchemy import Vector
+import numpy as np
+
+from app.core.config import settings
+
+EMBEDDING_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+
+class HalfVector(Vector):
+    """pgvector halfvec column: 2 bytes per dimension, same operators as vector"""
+    cache_ok = True
+    
+    def get_col_spec(self, **kw):
+        if self.dim is None:
+            return "HALFVEC"
+        return f"HALFVEC({self.dim})"
+
+
+class PackedEmbedding(TypeDecorator):
+    """
+    Embedding packed into bytea as raw little-endian float32 or float16
+    
+    Loads decode with np.frombuffer, so a row costs one buffer instead of a
+    Python float per dimension. Values come back as float32 arrays.
+    """
+    impl = LargeBinary
+    cache_ok = True
+    
+    def __init__(self, dtype: str = "float32"):
+        super().__init__()
+        self.dtype = np.dtype(EMBEDDING_DTYPES[dtype]).newbyteorder("<")
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return pack_embedding(value, self.dtype)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return unpack_embedding(value, self.dtype)
+
+
+def pack_embedding(embedding, dtype=np.float32) -> bytes:
+    """Raw bytes of an embedding in the storage dtype"""
+    return np.asarray(embedding, dtype=dtype).tobytes()
+
+
+def unpack_embedding(data: bytes, dtype=np.float32) -> np.ndarray:
+    """Float32 array over packed embedding bytes; zero-copy for float32 storage"""
+    array = np.frombuffer(data, dtype=dtype)
+    return array if array.dtype == np.float32 else array.astype(np.float32)
+
+
+def embedding_column_type():
+    """Column type of Feedback.embedding for the configured backend and storage dtype"""
+    half = settings.EMBEDDING_STORAGE_DTYPE == "float16"
+    if settings.VECTOR_SEARCH_BACKEND == "pgvector":
+        return HalfVector(settings.EMBEDDING_DIM) if half else Vector(settings.EMBEDDING_DIM)
+    return PackedEmbedding(settings.EMBEDDING_STORAGE_DTYPE)
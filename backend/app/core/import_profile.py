@@ -0,0 +1,123 @@
+"""
+Import-Time Profile
+Measures what importing the API costs a fresh uvicorn worker
+
+    python -m app.core.import_profile [--module app.main] [--budget 1.0]
+
+The import runs in a clean interpreter under `-X importtime`. The check
+fails when it takes longer than the budget or loads one of HEAVY_MODULES,
+which belong in the Celery worker, not the API.
+"""
+
+from collections import defaultdict
+from typing import Dict, List
+import argparse
+import json
+import subprocess
+import sys
+
+# ML and data libraries that must only load on first use
+HEAVY_MODULES = (
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "onnxruntime",
+    "sklearn",
+    "scipy",
+    "joblib",
+    "pandas",
+)
+
+DEFAULT_BUDGET_SECONDS = 1.0
+
+_PROBE = """
+import resource, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def profile_import(module: str = "app.main", top_n: int = 15) -> Dict:
+    """
+    Import `module` in a subprocess and break down where the time went
+    
+    Returns:
+        Wall seconds, peak RSS, heavy modules loaded, the slowest imports by
+        cumulative time and the top-level packages by their own time
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    
+    seconds, max_rss_kb = result.stdout.strip().splitlines()[-2:]
+    entries = _parse_importtime(result.stderr)
+    
+    by_package = defaultdict(int)
+    for entry in entries:
+        by_package[entry["module"].split(".")[0]] += entry["self_us"]
+    
+    loaded = {entry["module"].split(".")[0] for entry in entries}
+    slowest = sorted(entries, key=lambda entry: entry["cumulative_us"], reverse=True)[:top_n]
+    
+    return {
+        "module": module,
+        "seconds": round(float(seconds), 3),
+        "max_rss_mb": round(int(max_rss_kb) / 1024, 1),
+        "modules_imported": len(entries),
+        "heavy_modules": sorted(loaded.intersection(HEAVY_MODULES)),
+        "slowest_imports": [
+            {"module": entry["module"], "cumulative_ms": round(entry["cumulative_us"] / 1000, 1)}
+            for entry in slowest
+        ],
+        "packages_by_self_ms": {
+            package: round(us / 1000, 1)
+            for package, us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        },
+    }
+
+
+def _parse_importtime(stderr: str) -> List[Dict]:
+    """Rows of `-X importtime` output: 'import time: self [us] | cumulative | imported package'"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    return entries
+
+
+def check(report: Dict, budget: float = DEFAULT_BUDGET_SECONDS) -> List[str]:
+    """Cold-start problems in a profile, empty when within budget"""
+    problems = []
+    if report["seconds"] > budget:
+        problems.append(f"import took {report['seconds']}s, budget is {budget}s")
+    if report["heavy_modules"]:
+        problems.append(f"heavy modules loaded at import: {', '.join(report['heavy_modules'])}")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the import time of the API")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="Max import seconds")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    
+    report = profile_import(args.module, args.top)
+    print(json.dumps(report, indent=2))
+    
+    problems = check(report, args.budget)
+    for problem in problems:
+        print(f"❌ {problem}", file=sys.stderr)
+    sys.exit(1 if problems else 0)
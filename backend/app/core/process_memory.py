@@ -0,0 +1,52 @@
+"""
+Process Memory Accounting
+RSS, PSS and shared/private split of a process, from /proc (Linux)
+"""
+
+from typing import Dict, List, Optional
+import os
+
+_ROLLUP_FIELDS = {
+    "Rss": "rss_mb",
+    "Pss": "pss_mb",
+    "Shared_Clean": "shared_clean_mb",
+    "Shared_Dirty": "shared_dirty_mb",
+    "Private_Clean": "private_clean_mb",
+    "Private_Dirty": "private_dirty_mb",
+}
+
+
+def process_memory(pid: Optional[int] = None) -> Dict:
+    """
+    Memory of one process in MB
+    
+    RSS counts copy-on-write pages shared with the parent in full for every
+    process; PSS splits them between the sharers, so the PSS of all workers
+    sums to what the host actually spends. `private_mb` is what a process
+    would free on exit.
+    """
+    pid = pid or os.getpid()
+    usage = {"pid": pid}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in _ROLLUP_FIELDS:
+                    usage[_ROLLUP_FIELDS[name]] = round(int(value.split()[0]) / 1024, 1)
+    except OSError as e:
+        usage["error"] = str(e)
+        return usage
+    
+    usage["shared_mb"] = round(usage.get("shared_clean_mb", 0) + usage.get("shared_dirty_mb", 0), 1)
+    usage["private_mb"] = round(usage.get("private_clean_mb", 0) + usage.get("private_dirty_mb", 0), 1)
+    return usage
+
+
+def child_pids(pid: Optional[int] = None) -> List[int]:
+    """Direct children of a process"""
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
@@ -0,0 +1,124 @@
+"""
+Query Plan Benchmark
+Runs EXPLAIN ANALYZE on the hot tenant-scoped feedback queries with and
+without the feedback indexes, to show the plan change for each endpoint
+
+    python -m app.db.benchmark_queries <tenant_id> [--runs 3]
+
+The "without" pass drops the indexes inside a transaction that is rolled
+back, which holds an exclusive lock on feedbacks meanwhile, so point it at
+a staging copy rather than production.
+"""
+
+from sqlalchemy import text
+from app.core.database import AsyncSessionLocal
+from app.db.migrations.add_feedback_query_indexes import FEEDBACK_QUERY_INDEXES
+import argparse
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAGINATION_INDEX = "ix_feedbacks_tenant_created_id"
+
+# Endpoint query -> SQL mirroring what the endpoint sends
+BENCHMARKS = {
+    "GET /feedback (first page)": """
+        SELECT * FROM feedbacks WHERE tenant_id = :tenant_id
+        ORDER BY created_at DESC, id DESC LIMIT 51
+    """,
+    "GET /feedback (cursor page)": """
+        SELECT * FROM feedbacks WHERE tenant_id = :tenant_id
+        AND (created_at, id) < (
+            SELECT created_at, id FROM feedbacks WHERE tenant_id = :tenant_id
+            ORDER BY created_at DESC, id DESC OFFSET 5000 LIMIT 1
+        )
+        ORDER BY created_at DESC, id DESC LIMIT 51
+    """,
+    "GET /feedback?sentiment=negative": """
+        SELECT * FROM feedbacks WHERE tenant_id = :tenant_id AND sentiment = 'NEGATIVE'
+        ORDER BY created_at DESC, id DESC LIMIT 51
+    """,
+    "GET /feedback?urgency_level=critical": """
+        SELECT * FROM feedbacks WHERE tenant_id = :tenant_id AND urgency_level = 'CRITICAL'
+        ORDER BY created_at DESC, id DESC LIMIT 51
+    """,
+    "GET /feedback?topic=cluster_0": """
+        SELECT * FROM feedbacks WHERE tenant_id = :tenant_id AND topics @> ARRAY['cluster_0']::varchar[]
+        ORDER BY created_at DESC, id DESC LIMIT 51
+    """,
+    "GET /feedback?keyword=refund": """
+        SELECT * FROM feedbacks WHERE tenant_id = :tenant_id AND keywords @> ARRAY['refund']::varchar[]
+        ORDER BY created_at DESC, id DESC LIMIT 51
+    """,
+    "GET /analytics/dashboard (pending analysis)": """
+        SELECT count(id) FROM feedbacks WHERE tenant_id = :tenant_id
+        AND analyzed_at IS NULL AND created_at >= now() - interval '30 days'
+    """,
+    "GET /analytics/trends/sentiment?granularity=hour": """
+        SELECT date_trunc('hour', created_at) AS bucket, count(id), sum(sentiment_score)
+        FROM feedbacks WHERE tenant_id = :tenant_id
+        AND analyzed_at IS NOT NULL AND created_at >= now() - interval '7 days'
+        GROUP BY bucket
+    """,
+}
+
+
+async def _explain(db, sql: str, tenant_id: str, runs: int) -> dict:
+    """Best of `runs` EXPLAIN ANALYZE executions"""
+    best = None
+    for _ in range(runs):
+        result = await db.execute(
+            text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), {"tenant_id": tenant_id}
+        )
+        plan = result.scalar()
+        plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]
+        if best is None or plan["Execution Time"] < best["Execution Time"]:
+            best = plan
+    return best
+
+
+def _plan_summary(node: dict) -> str:
+    """Node types of a plan tree with the indexes they use, outermost first"""
+    label = node["Node Type"]
+    if "Index Name" in node:
+        label += f" using {node['Index Name']}"
+    children = [_plan_summary(child) for child in node.get("Plans", [])]
+    return label + (f" -> [{', '.join(children)}]" if children else "")
+
+
+async def run_benchmark(tenant_id: str, runs: int = 3):
+    """Print plan and timing of every benchmark query with and without the indexes"""
+    indexes = [PAGINATION_INDEX, *FEEDBACK_QUERY_INDEXES]
+    
+    async with AsyncSessionLocal() as db:
+        with_indexes = {
+            name: await _explain(db, sql, tenant_id, runs) for name, sql in BENCHMARKS.items()
+        }
+        
+        try:
+            for index in indexes:
+                await db.execute(text(f"DROP INDEX IF EXISTS {index};"))
+            without_indexes = {
+                name: await _explain(db, sql, tenant_id, runs) for name, sql in BENCHMARKS.items()
+            }
+        finally:
+            # DROP INDEX is transactional; this restores every index
+            await db.rollback()
+    
+    for name in BENCHMARKS:
+        before, after = without_indexes[name], with_indexes[name]
+        print(f"\n{name}")
+        print(f"  without indexes: {before['Execution Time']:9.2f} ms  {_plan_summary(before['Plan'])}")
+        print(f"  with indexes:    {after['Execution Time']:9.2f} ms  {_plan_summary(after['Plan'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare feedback query plans with and without indexes")
+    parser.add_argument("tenant_id")
+    parser.add_argument("--runs", type=int, default=3, help="Executions per query; the fastest is reported")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_benchmark(args.tenant_id, args.runs))
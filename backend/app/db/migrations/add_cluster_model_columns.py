@@ -0,0 +1,42 @@
+"""
+Add centroid and drift tracking columns to feedback_clusters table
+"""
+
+from sqlalchemy import text
+from app.core.database import AsyncSessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def add_cluster_model_columns():
+    """Add label, centroid, radius and drift counter columns to feedback_clusters table"""
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.execute(text("""
+                ALTER TABLE feedback_clusters
+                ADD COLUMN IF NOT EXISTS label INTEGER,
+                ADD COLUMN IF NOT EXISTS centroid DOUBLE PRECISION[],
+                ADD COLUMN IF NOT EXISTS radius DOUBLE PRECISION,
+                ADD COLUMN IF NOT EXISTS assigned_since_fit INTEGER DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS outliers_since_fit INTEGER DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+            """))
+            
+            await db.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_feedback_clusters_tenant_id
+                ON feedback_clusters (tenant_id);
+            """))
+            
+            await db.commit()
+            logger.info("✅ Successfully added model columns to feedback_clusters table")
+        
+        except Exception as e:
+            logger.error(f"❌ Error adding cluster model columns: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(add_cluster_model_columns())
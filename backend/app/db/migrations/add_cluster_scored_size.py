@@ -0,0 +1,48 @@
+"""
+Add scored_size column to feedback_clusters table
+"""
+
+from sqlalchemy import text
+from app.core.database import AsyncSessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def add_cluster_scored_size():
+    """Add scored_size, the number of members with a sentiment score, and backfill it"""
+    async with AsyncSessionLocal() as db:
+        try:
+            result = await db.execute(text("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'feedback_clusters' AND column_name = 'scored_size';
+            """))
+            if result.scalar() is None:
+                await db.execute(text("""
+                    ALTER TABLE feedback_clusters ADD COLUMN scored_size INTEGER DEFAULT 0;
+                """))
+                
+                await db.execute(text("""
+                    UPDATE feedback_clusters c
+                    SET scored_size = counts.scored
+                    FROM (
+                        SELECT a.cluster_id, count(f.sentiment_score) AS scored
+                        FROM feedback_cluster_association a
+                        JOIN feedbacks f ON f.id = a.feedback_id
+                        GROUP BY a.cluster_id
+                    ) counts
+                    WHERE c.id = counts.cluster_id;
+                """))
+            
+            await db.commit()
+            logger.info("✅ Successfully added scored_size column to feedback_clusters table")
+        
+        except Exception as e:
+            logger.error(f"❌ Error adding cluster scored_size column: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(add_cluster_scored_size())
@@ -0,0 +1,39 @@
+"""
+Add topic trend columns to feedback_clusters table
+"""
+
+from sqlalchemy import text
+from app.core.database import AsyncSessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def add_cluster_trend_columns():
+    """Add recent_size, previous_size and trend columns, and index memberships by cluster"""
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.execute(text("""
+                ALTER TABLE feedback_clusters
+                ADD COLUMN IF NOT EXISTS recent_size INTEGER DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS previous_size INTEGER DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS trend DOUBLE PRECISION;
+            """))
+            
+            await db.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_feedback_cluster_association_cluster_id
+                ON feedback_cluster_association (cluster_id);
+            """))
+            
+            await db.commit()
+            logger.info("✅ Successfully added trend columns to feedback_clusters table")
+        
+        except Exception as e:
+            logger.error(f"❌ Error adding cluster trend columns: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(add_cluster_trend_columns())
@@ -0,0 +1,57 @@
+"""
+Convert feedbacks.embedding from ARRAY(Float) to a pgvector column with an HNSW index
+"""
+
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def add_embedding_vector_column():
+    """Convert embedding to vector(EMBEDDING_DIM), backfill existing arrays and index it"""
+    if settings.VECTOR_SEARCH_BACKEND != "pgvector":
+        logger.info("Vector search backend is not pgvector, keeping float array embeddings")
+        return
+
+    dim = int(settings.EMBEDDING_DIM)
+
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
+
+            result = await db.execute(text("""
+                SELECT udt_name FROM information_schema.columns
+                WHERE table_name = 'feedbacks' AND column_name = 'embedding';
+            """))
+            column_type = result.scalar()
+
+            # Backfill in place; arrays of the wrong size (failed embeddings) become NULL
+            if column_type == "_float8":
+                await db.execute(text(f"""
+                    ALTER TABLE feedbacks
+                    ALTER COLUMN embedding TYPE vector({dim})
+                    USING CASE
+                        WHEN cardinality(embedding) = {dim} THEN embedding::vector({dim})
+                    END;
+                """))
+
+            await db.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_feedbacks_embedding_hnsw
+                ON feedbacks USING hnsw (embedding vector_cosine_ops);
+            """))
+
+            await db.commit()
+            logger.info("✅ Successfully converted feedbacks.embedding to an indexed vector column")
+
+        except Exception as e:
+            logger.error(f"❌ Error converting embedding column: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(add_embedding_vector_column())
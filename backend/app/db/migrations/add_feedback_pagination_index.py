@@ -0,0 +1,32 @@
+"""
+Add the composite index behind keyset pagination of the feedback list
+"""
+
+from sqlalchemy import text
+from app.core.database import AsyncSessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def add_feedback_pagination_index():
+    """Index feedbacks by (tenant_id, created_at DESC, id DESC)"""
+    async with AsyncSessionLocal() as db:
+        try:
+            await db.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_feedbacks_tenant_created_id
+                ON feedbacks (tenant_id, created_at DESC, id DESC);
+            """))
+            
+            await db.commit()
+            logger.info("✅ Successfully added feedback pagination index")
+        
+        except Exception as e:
+            logger.error(f"❌ Error adding feedback pagination index: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(add_feedback_pagination_index())
@@ -0,0 +1,46 @@
+"""
+Add composite, partial and GIN indexes for tenant-scoped feedback queries
+"""
+
+from sqlalchemy import text
+from app.core.database import AsyncSessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tenant + created_at is covered by ix_feedbacks_tenant_created_id (add_feedback_pagination_index)
+FEEDBACK_QUERY_INDEXES = {
+    # Feedback list filtered by sentiment or urgency, newest first
+    "ix_feedbacks_tenant_sentiment_created": "ON feedbacks (tenant_id, sentiment, created_at DESC)",
+    "ix_feedbacks_tenant_urgency_created": "ON feedbacks (tenant_id, urgency_level, created_at DESC)",
+    # Analysis backlog; stays small because analyzed rows drop out of it
+    "ix_feedbacks_tenant_unanalyzed": "ON feedbacks (tenant_id, created_at) WHERE analyzed_at IS NULL",
+    # Array containment filters (@>)
+    "ix_feedbacks_keywords_gin": "ON feedbacks USING gin (keywords)",
+    "ix_feedbacks_topics_gin": "ON feedbacks USING gin (topics)",
+    "ix_feedbacks_competitor_names_gin": "ON feedbacks USING gin (competitor_names)",
+}
+
+
+async def add_feedback_query_indexes():
+    """Create the feedback query indexes that don't exist yet"""
+    async with AsyncSessionLocal() as db:
+        try:
+            for name, definition in FEEDBACK_QUERY_INDEXES.items():
+                await db.execute(text(f"CREATE INDEX IF NOT EXISTS {name} {definition};"))
+            
+            # Fresh statistics so the planner picks the new indexes up right away
+            await db.execute(text("ANALYZE feedbacks;"))
+            
+            await db.commit()
+            logger.info("✅ Successfully added feedback query indexes")
+        
+        except Exception as e:
+            logger.error(f"❌ Error adding feedback query indexes: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(add_feedback_query_indexes())
@@ -0,0 +1,39 @@
+"""
+Backfill feedback_daily_rollups from existing analyzed feedback
+"""
+
+from sqlalchemy import select, exists
+from app.core.database import AsyncSessionLocal
+from app.models import Feedback, FeedbackDailyRollup
+from app.services.analytics_rollup import rebuild_rollups
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill_daily_rollups():
+    """Build the rollups once when the table is empty but analyzed feedback exists"""
+    async with AsyncSessionLocal() as db:
+        try:
+            has_rollups = await db.scalar(select(exists().select_from(FeedbackDailyRollup)))
+            if has_rollups:
+                logger.info("Daily rollups already populated, skipping backfill")
+                return
+            
+            has_feedback = await db.scalar(select(exists().where(Feedback.analyzed_at.isnot(None))))
+            if not has_feedback:
+                return
+            
+            rows = await rebuild_rollups(db)
+            await db.commit()
+            logger.info(f"✅ Successfully backfilled {rows} daily rollup rows")
+        
+        except Exception as e:
+            logger.error(f"❌ Error backfilling daily rollups: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(backfill_daily_rollups())
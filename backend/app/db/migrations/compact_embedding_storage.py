@@ -0,0 +1,130 @@
+"""
+Convert feedbacks.embedding to compact storage (EMBEDDING_STORAGE_DTYPE)
+
+pgvector: vector <-> halfvec, rebuilding the HNSW index with matching ops.
+Memory backend: double precision[] -> packed float32/float16 bytea, rewritten
+in batches; packed rows of the other dtype are re-encoded. Embeddings that
+don't have EMBEDDING_DIM values (baseline stored '{}' for failed ones) become
+NULL, as in the pgvector migration.
+"""
+
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.embedding_types import EMBEDDING_DTYPES, pack_embedding, unpack_embedding
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+async def compact_embedding_storage():
+    """Bring the embedding column in line with the configured backend and dtype"""
+    async with AsyncSessionLocal() as db:
+        try:
+            result = await db.execute(text("""
+                SELECT udt_name FROM information_schema.columns
+                WHERE table_name = 'feedbacks' AND column_name = 'embedding';
+            """))
+            column_type = result.scalar()
+            
+            if settings.VECTOR_SEARCH_BACKEND == "pgvector":
+                await _convert_pgvector(db, column_type)
+            else:
+                await _convert_packed(db, column_type)
+            
+            await db.commit()
+            logger.info(f"✅ Successfully stored embeddings as {settings.EMBEDDING_STORAGE_DTYPE}")
+        
+        except Exception as e:
+            logger.error(f"❌ Error compacting embedding storage: {e}")
+            await db.rollback()
+            raise
+
+
+async def _convert_pgvector(db, column_type: str):
+    dim = int(settings.EMBEDDING_DIM)
+    target = "halfvec" if settings.EMBEDDING_STORAGE_DTYPE == "float16" else "vector"
+    if column_type not in ("vector", "halfvec") or column_type == target:
+        return
+    
+    # The HNSW operator class is type specific, so the index is rebuilt
+    await db.execute(text("DROP INDEX IF EXISTS ix_feedbacks_embedding_hnsw;"))
+    await db.execute(text(f"""
+        ALTER TABLE feedbacks
+        ALTER COLUMN embedding TYPE {target}({dim})
+        USING embedding::{target}({dim});
+    """))
+    await db.execute(text(f"""
+        CREATE INDEX ix_feedbacks_embedding_hnsw
+        ON feedbacks USING hnsw (embedding {target}_cosine_ops);
+    """))
+
+
+async def _convert_packed(db, column_type: str):
+    dim = int(settings.EMBEDDING_DIM)
+    dtype = EMBEDDING_DTYPES[settings.EMBEDDING_STORAGE_DTYPE]
+    
+    if column_type == "_float8":
+        await db.execute(text("""
+            UPDATE feedbacks SET embedding = NULL
+            WHERE embedding IS NOT NULL AND cardinality(embedding) <> :dim;
+        """), {"dim": dim})
+        await db.execute(text("ALTER TABLE feedbacks ADD COLUMN IF NOT EXISTS embedding_packed BYTEA;"))
+        
+        while True:
+            result = await db.execute(text("""
+                SELECT id, embedding FROM feedbacks
+                WHERE embedding IS NOT NULL AND embedding_packed IS NULL
+                LIMIT :limit;
+            """), {"limit": BATCH_SIZE})
+            rows = result.all()
+            if not rows:
+                break
+            
+            await db.execute(
+                text("UPDATE feedbacks SET embedding_packed = :packed WHERE id = :id;"),
+                [{"id": row.id, "packed": pack_embedding(row.embedding, dtype)} for row in rows]
+            )
+        
+        await db.execute(text("ALTER TABLE feedbacks DROP COLUMN embedding;"))
+        await db.execute(text("ALTER TABLE feedbacks RENAME COLUMN embedding_packed TO embedding;"))
+        return
+    
+    if column_type != "bytea":
+        return
+    
+    # Rows packed from empty or mis-sized arrays by an earlier run
+    await db.execute(text("""
+        UPDATE feedbacks SET embedding = NULL
+        WHERE embedding IS NOT NULL AND octet_length(embedding) NOT IN (:half_length, :full_length);
+    """), {"half_length": dim * 2, "full_length": dim * 4})
+    
+    # Packed with the other dtype; the byte length tells them apart
+    other = np.float16 if dtype == np.float32 else np.float32
+    other_length = dim * np.dtype(other).itemsize
+    while True:
+        result = await db.execute(text("""
+            SELECT id, embedding FROM feedbacks
+            WHERE octet_length(embedding) = :length
+            LIMIT :limit;
+        """), {"length": other_length, "limit": BATCH_SIZE})
+        rows = result.all()
+        if not rows:
+            break
+        
+        await db.execute(
+            text("UPDATE feedbacks SET embedding = :packed WHERE id = :id;"),
+            [
+                {"id": row.id, "packed": pack_embedding(unpack_embedding(row.embedding, other), dtype)}
+                for row in rows
+            ]
+        )
+
+
+if __name__ == "__main__":
+    import asyncio
+    asyncio.run(compact_embedding_storage())
@@ -8,6 +8,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+from starlette.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 import logging
 import time
@@ -17,6 +18,7 @@ from app.core.database import engine, Base
 from app.api.v1 import api_router
 from app.middleware.rate_limit import RateLimitMiddleware
 from app.middleware.logging import LoggingMiddleware
+from app.services.analysis_cache import analysis_cache_stats
 
 # Configure logging
 logging.basicConfig(
@@ -59,6 +61,62 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Failed to add super admin column: {e}")
     
+    # Convert embeddings to an indexed pgvector column
+    try:
+        from app.db.migrations.add_embedding_vector_column import add_embedding_vector_column
+        await add_embedding_vector_column()
+    except Exception as e:
+        logger.warning(f"Failed to convert embedding column: {e}")
+    
+    # Store embeddings as float32/float16
+    try:
+        from app.db.migrations.compact_embedding_storage import compact_embedding_storage
+        await compact_embedding_storage()
+    except Exception as e:
+        logger.warning(f"Failed to compact embedding storage: {e}")
+    
+    # Add cluster centroid and drift columns
+    try:
+        from app.db.migrations.add_cluster_model_columns import add_cluster_model_columns
+        await add_cluster_model_columns()
+    except Exception as e:
+        logger.warning(f"Failed to add cluster model columns: {e}")
+    
+    # Add cluster topic trend columns
+    try:
+        from app.db.migrations.add_cluster_trend_columns import add_cluster_trend_columns
+        await add_cluster_trend_columns()
+    except Exception as e:
+        logger.warning(f"Failed to add cluster trend columns: {e}")
+    
+    # Add cluster scored member count
+    try:
+        from app.db.migrations.add_cluster_scored_size import add_cluster_scored_size
+        await add_cluster_scored_size()
+    except Exception as e:
+        logger.warning(f"Failed to add cluster scored_size column: {e}")
+    
+    # Add feedback list pagination index
+    try:
+        from app.db.migrations.add_feedback_pagination_index import add_feedback_pagination_index
+        await add_feedback_pagination_index()
+    except Exception as e:
+        logger.warning(f"Failed to add feedback pagination index: {e}")
+    
+    # Add tenant-scoped feedback query indexes
+    try:
+        from app.db.migrations.add_feedback_query_indexes import add_feedback_query_indexes
+        await add_feedback_query_indexes()
+    except Exception as e:
+        logger.warning(f"Failed to add feedback query indexes: {e}")
+    
+    # Backfill daily analytics rollups
+    try:
+        from app.db.migrations.backfill_daily_rollups import backfill_daily_rollups
+        await backfill_daily_rollups()
+    except Exception as e:
+        logger.warning(f"Failed to backfill daily rollups: {e}")
+    
     logger.info("✅ Application startup complete")
     
     yield
@@ -87,6 +145,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.add_middleware(GZipMiddleware, minimum_size=1000)
@@ -150,7 +209,8 @@ async def metrics():
     return {
         "total_requests": 0,
         "active_connections": 0,
-        "uptime": 0
+        "uptime": 0,
+        "analysis_cache": await run_in_threadpool(analysis_cache_stats)
     }
 
 
@@ -2,14 +2,21 @@
 Database Models for Feedback Analyzer
 """
 
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, Boolean, ForeignKey, JSON, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, Float, Date, DateTime, Boolean, ForeignKey, JSON, Enum, Index
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from datetime import datetime
 import uuid
 import enum
 
+from app.core.config import settings
 from app.core.database import Base
+from app.core.embedding_types import embedding_column_type
+
+# Embeddings live in a pgvector column unless the extension isn't available,
+# in which case similarity search falls back to the in-process vector index
+USE_PGVECTOR = settings.VECTOR_SEARCH_BACKEND == "pgvector"
+EMBEDDING_INDEX_OPS = "halfvec_cosine_ops" if settings.EMBEDDING_STORAGE_DTYPE == "float16" else "vector_cosine_ops"
 
 
 class SentimentEnum(str, enum.Enum):
@@ -89,13 +96,13 @@ class Feedback(Base):
     # Metadata
     submitted_at = Column(DateTime, default=datetime.utcnow)
     language = Column(String(10), default="en")
-    feedback_metadata = Column(JSON, default={})
+    feedback_metadata = deferred(Column(JSON, default={}))
     
     # AI Analysis Results
     sentiment = Column(Enum(SentimentEnum))
     sentiment_score = Column(Float)  # -1 to 1
     emotion = Column(String(50))  # joy, anger, sadness, fear, etc.
-    emotion_scores = Column(JSON)  # Detailed emotion breakdown
+    emotion_scores = deferred(Column(JSON))  # Detailed emotion breakdown
     urgency_level = Column(Enum(UrgencyLevel))
     urgency_score = Column(Integer)  # 1-10
     
@@ -105,8 +112,8 @@ class Feedback(Base):
     topics = Column(ARRAY(String))
     keywords = Column(ARRAY(String))
     
-    # Embeddings for similarity search
-    embedding = Column(ARRAY(Float))  # Vector embedding
+    # Embeddings for similarity search; deferred, so load them explicitly where needed
+    embedding = deferred(Column(embedding_column_type()))
     
     # Additional insights
     is_feature_request = Column(Boolean, default=False)
@@ -127,6 +134,29 @@ class Feedback(Base):
     tenant = relationship("Tenant", back_populates="feedbacks")
     annotations = relationship("Annotation", back_populates="feedback")
     clusters = relationship("FeedbackCluster", secondary="feedback_cluster_association", back_populates="feedbacks")
+    
+    __table_args__ = (
+        # Keyset pagination of the feedback list, newest first; also serves tenant date ranges
+        Index("ix_feedbacks_tenant_created_id", "tenant_id", created_at.desc(), id.desc()),
+        # Filtered lists, see app/db/migrations/add_feedback_query_indexes.py
+        Index("ix_feedbacks_tenant_sentiment_created", "tenant_id", "sentiment", created_at.desc()),
+        Index("ix_feedbacks_tenant_urgency_created", "tenant_id", "urgency_level", created_at.desc()),
+        Index(
+            "ix_feedbacks_tenant_unanalyzed",
+            "tenant_id", "created_at",
+            postgresql_where=analyzed_at.is_(None)
+        ),
+        Index("ix_feedbacks_keywords_gin", "keywords", postgresql_using="gin"),
+        Index("ix_feedbacks_topics_gin", "topics", postgresql_using="gin"),
+        Index("ix_feedbacks_competitor_names_gin", "competitor_names", postgresql_using="gin"),
+    ) + ((
+        Index(
+            "ix_feedbacks_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": EMBEDDING_INDEX_OPS}
+        ),
+    ) if USE_PGVECTOR else ())
 
 
 class Category(Base):
@@ -151,14 +181,29 @@ class FeedbackCluster(Base):
     __tablename__ = "feedback_clusters"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"))
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), index=True)
+    label = Column(Integer)  # Cluster number within the tenant's run (cluster_<label> topic)
     name = Column(String(255))
     description = Column(Text)
     size = Column(Integer)  # Number of feedback items
     avg_sentiment = Column(Float)
+    scored_size = Column(Integer, default=0)  # Members with a sentiment score, the weight of avg_sentiment
     top_keywords = Column(ARRAY(String))
     representative_texts = Column(ARRAY(Text))  # Sample feedback
+    
+    # Model state for warm starts and incremental assignment
+    centroid = Column(ARRAY(Float))
+    radius = Column(Float)  # 95th percentile member distance at fit time
+    assigned_since_fit = Column(Integer, default=0)
+    outliers_since_fit = Column(Integer, default=0)
+    
+    # Topic trend: members created in the last CLUSTER_TREND_DAYS vs the window before
+    recent_size = Column(Integer, default=0)
+    previous_size = Column(Integer, default=0)
+    trend = Column(Float)  # Relative change, (recent - previous) / previous
+    
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     feedbacks = relationship("Feedback", secondary="feedback_cluster_association", back_populates="clusters")
@@ -169,10 +214,35 @@ class FeedbackClusterAssociation(Base):
     __tablename__ = "feedback_cluster_association"
     
     feedback_id = Column(UUID(as_uuid=True), ForeignKey("feedbacks.id"), primary_key=True)
-    cluster_id = Column(UUID(as_uuid=True), ForeignKey("feedback_clusters.id"), primary_key=True)
+    cluster_id = Column(UUID(as_uuid=True), ForeignKey("feedback_clusters.id"), primary_key=True, index=True)
     similarity_score = Column(Float)
 
 
+class FeedbackDailyRollup(Base):
+    """Per-day analytics counters of analyzed feedback, maintained incrementally"""
+    __tablename__ = "feedback_daily_rollups"
+    
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # Day of created_at
+    source = Column(String(50), primary_key=True, default="")  # "" when unset
+    channel = Column(String(50), primary_key=True, default="")  # "" when unset
+    
+    total_count = Column(Integer, default=0, nullable=False)
+    positive_count = Column(Integer, default=0, nullable=False)
+    negative_count = Column(Integer, default=0, nullable=False)
+    neutral_count = Column(Integer, default=0, nullable=False)
+    low_count = Column(Integer, default=0, nullable=False)
+    medium_count = Column(Integer, default=0, nullable=False)
+    high_count = Column(Integer, default=0, nullable=False)
+    critical_count = Column(Integer, default=0, nullable=False)
+    sentiment_sum = Column(Float, default=0.0, nullable=False)
+    sentiment_count = Column(Integer, default=0, nullable=False)  # Rows with a sentiment score
+    feature_request_count = Column(Integer, default=0, nullable=False)
+    bug_report_count = Column(Integer, default=0, nullable=False)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class Annotation(Base):
     """User annotations on feedback"""
     __tablename__ = "annotations"
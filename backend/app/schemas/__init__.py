@@ -152,11 +152,23 @@ class SentimentTrend(BaseModel):
     avg_score: float
 
 
+class SentimentTrendPoint(SentimentTrend):
+    total: int
+    moving_avg: float  # Trailing moving average of avg_score, weighted by scored items
+
+
+class SentimentTrendsResponse(BaseModel):
+    granularity: str
+    buckets_per_point: int  # >1 when the range was downsampled to max_points
+    points: List[SentimentTrendPoint]
+
+
 class TopicDistribution(BaseModel):
     topic: str
     count: int
     percentage: float
     avg_sentiment: float
+    trend: Optional[float] = None  # Relative change in new members, None without history
 
 
 class DashboardStats(BaseModel):
@@ -1,27 +1,144 @@
 """
 AI/ML Service for Sentiment Analysis, Emotion Detection, and Text Analysis
+
+torch, transformers and the inference backends are imported when the
+analyzer is first created, not with this module. The API imports it only
+through the Celery task module, to enqueue analysis, and never loads them.
 """
 
-import torch
-from transformers import (
-    AutoTokenizer, 
-    AutoModelForSequenceClassification,
-    pipeline
-)
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import Dict, List, Tuple
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+import bisect
 import logging
+import os
+import threading
+import time
 
 from app.core.config import settings
+from app.services.analysis_cache import get_analysis_cache, model_fingerprint, normalize_text
 
 logger = logging.getLogger(__name__)
 
 
+class LengthBucketedBatcher:
+    """
+    Dynamic batching scheduler in front of one model
+    
+    Single-text calls from concurrent threads are queued into buckets by
+    token length. A bucket is flushed through `batch_fn` as soon as it holds
+    `max_batch_size` texts or its oldest text has waited `max_wait_ms`, so
+    padding stays within one length bucket and latency stays bounded. It
+    only pays off with many concurrent callers, so only the inference
+    server turns it on.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[List[str]], List],
+        length_fn: Callable[[str], int],
+        buckets: List[int],
+        max_batch_size: int,
+        max_wait_ms: int
+    ):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.length_fn = length_fn
+        self.buckets = sorted(buckets)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._reset()
+        
+        # Threads and locks do not survive fork; children start clean
+        os.register_at_fork(after_in_child=self._reset)
+    
+    def _reset(self):
+        self._pending: Dict[int, List[Tuple[str, Future, float]]] = {}
+        self._condition = threading.Condition()
+        self._worker = None
+    
+    def submit(self, text: str, length: int = None) -> Future:
+        """Queue a text and return a future for its result; `length` skips re-tokenizing"""
+        future = Future()
+        bucket = bisect.bisect_left(self.buckets, self.length_fn(text) if length is None else length)
+        
+        with self._condition:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name=f"{self.name}-batcher",
+                    daemon=True
+                )
+                self._worker.start()
+            
+            self._pending.setdefault(bucket, []).append((text, future, time.monotonic()))
+            self._condition.notify()
+        
+        return future
+    
+    def __call__(self, text: str):
+        return self.submit(text).result()
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                batch = self._take_ready_batch()
+                while batch is None:
+                    self._condition.wait(self._next_timeout())
+                    batch = self._take_ready_batch()
+            
+            self._flush(batch)
+    
+    def _take_ready_batch(self):
+        """Pop the full or expired bucket with the oldest waiting text"""
+        now = time.monotonic()
+        ready = [
+            bucket for bucket, items in self._pending.items()
+            if len(items) >= self.max_batch_size or now - items[0][2] >= self.max_wait
+        ]
+        if not ready:
+            return None
+        
+        bucket = min(ready, key=lambda b: self._pending[b][0][2])
+        items = self._pending[bucket]
+        batch, remaining = items[:self.max_batch_size], items[self.max_batch_size:]
+        
+        if remaining:
+            self._pending[bucket] = remaining
+        else:
+            del self._pending[bucket]
+        
+        return batch
+    
+    def _next_timeout(self):
+        """Seconds until the oldest pending text hits its deadline"""
+        if not self._pending:
+            return None
+        oldest = min(items[0][2] for items in self._pending.values())
+        return max(0.0, oldest + self.max_wait - time.monotonic())
+    
+    def _flush(self, batch: List[Tuple[str, Future, float]]):
+        texts = [text for text, _, _ in batch]
+        
+        try:
+            results = self.batch_fn(texts)
+        except Exception as e:
+            logger.error(f"{self.name} batch of {len(texts)} failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+
 class AIAnalyzer:
     """Main AI/ML analyzer for feedback"""
     
-    def __init__(self):
+    def __init__(self, dynamic_batching: bool = False):
+        import torch
+        
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Using device: {self.device}")
         
@@ -29,96 +146,172 @@ class AIAnalyzer:
         self._init_sentiment_model()
         self._init_emotion_model()
         self._init_embedding_model()
+        self.cache_fingerprint = model_fingerprint(self.model_variants())
         
+        # Dynamic batching schedulers, one per model, for concurrent callers
+        self.batchers: Dict[str, LengthBucketedBatcher] = {}
+        if dynamic_batching:
+            self._init_batchers()
+    
     def _init_sentiment_model(self):
         """Initialize sentiment analysis model"""
+        from transformers import AutoTokenizer
+        from app.services.inference_backends import load_classifier
+        
         try:
             self.sentiment_tokenizer = AutoTokenizer.from_pretrained(settings.SENTIMENT_MODEL)
-            self.sentiment_model = AutoModelForSequenceClassification.from_pretrained(
-                settings.SENTIMENT_MODEL
-            ).to(self.device)
+            self.sentiment_model = load_classifier(settings.SENTIMENT_MODEL, self.device)
             logger.info("Sentiment model loaded successfully")
         except Exception as e:
             logger.error(f"Error loading sentiment model: {e}")
             # Fallback to simpler model
+            from transformers import pipeline
             self.sentiment_pipeline = pipeline("sentiment-analysis", device=0 if self.device == "cuda" else -1)
     
     def _init_emotion_model(self):
         """Initialize emotion detection model"""
+        from app.services.inference_backends import load_classifier
+        
         try:
-            self.emotion_pipeline = pipeline(
-                "text-classification",
-                model=settings.EMOTION_MODEL,
-                top_k=None,
-                device=0 if self.device == "cuda" else -1
-            )
+            self.emotion_model = load_classifier(settings.EMOTION_MODEL, self.device)
             logger.info("Emotion model loaded successfully")
         except Exception as e:
             logger.error(f"Error loading emotion model: {e}")
-            self.emotion_pipeline = None
+            self.emotion_model = None
     
     def _init_embedding_model(self):
         """Initialize embedding model for similarity search"""
+        from app.services.inference_backends import load_embedder
+        
         try:
-            self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+            self.embedding_model = load_embedder(settings.EMBEDDING_MODEL, self.device)
             logger.info("Embedding model loaded successfully")
         except Exception as e:
             logger.error(f"Error loading embedding model: {e}")
             self.embedding_model = None
     
+    def model_variants(self) -> List[str]:
+        """Backend and precision of the sentiment, emotion and embedding models as loaded"""
+        models = (getattr(self, "sentiment_model", None), self.emotion_model, self.embedding_model)
+        return [getattr(model, "variant", "none") for model in models]
+    
+    def _init_batchers(self):
+        """Put a length-bucketed dynamic batcher in front of each model"""
+        for name, batch_fn in (
+            ("sentiment", self.analyze_sentiment_batch),
+            ("emotion", self.detect_emotion_batch),
+            ("embedding", self.generate_embedding_batch),
+        ):
+            self.batchers[name] = LengthBucketedBatcher(
+                name=name,
+                batch_fn=batch_fn,
+                length_fn=self._token_length,
+                buckets=settings.DYNAMIC_BATCH_LENGTH_BUCKETS,
+                max_batch_size=settings.ANALYSIS_BATCH_SIZE,
+                max_wait_ms=settings.DYNAMIC_BATCH_MAX_WAIT_MS
+            )
+        logger.info(f"Dynamic batching enabled ({settings.DYNAMIC_BATCH_MAX_WAIT_MS}ms max wait)")
+    
+    def _token_length(self, text: str) -> int:
+        """Token count used to group texts of similar length"""
+        try:
+            return len(self.sentiment_tokenizer(text, truncation=True, max_length=512)["input_ids"])
+        except Exception:
+            return len(text.split())
+    
+    def submit_model_outputs(self, text: str) -> List[Future]:
+        """Queue a text on the sentiment, emotion and embedding batchers, tokenizing it once"""
+        length = self._token_length(text)
+        return [self.batchers[name].submit(text, length) for name in ("sentiment", "emotion", "embedding")]
+    
+    def model_outputs_batch(self, texts: List[str]) -> List[Tuple[Dict, Dict, List[float]]]:
+        """(sentiment, emotion, embedding) per text, each model run once over the texts"""
+        return list(zip(
+            self.analyze_sentiment_batch(texts),
+            self.detect_emotion_batch(texts),
+            self.generate_embedding_batch(texts)
+        ))
+    
+    def _run_single(self, name: str, batch_fn: Callable[[List[str]], List], text: str):
+        """Route a single text through the model's batcher when enabled"""
+        batcher = self.batchers.get(name)
+        if batcher is not None:
+            return batcher(text)
+        return batch_fn([text])[0]
+    
     def analyze_sentiment(self, text: str) -> Dict[str, float]:
         """
         Analyze sentiment of text
         Returns: {"label": "positive/negative/neutral", "score": 0-1}
         """
+        return self._run_single("sentiment", self.analyze_sentiment_batch, text)
+    
+    def analyze_sentiment_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        """
+        Analyze sentiment of several texts in a single padded forward pass
+        Returns: One sentiment dict per text, same shape as analyze_sentiment
+        """
+        if not texts:
+            return []
+        
         try:
-            inputs = self.sentiment_tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            with torch.no_grad():
-                outputs = self.sentiment_model(**inputs)
-            
-            scores = torch.nn.functional.softmax(outputs.logits, dim=-1)
-            scores = scores.cpu().numpy()[0]
-            
-            # Map to sentiment labels
-            labels = ["negative", "neutral", "positive"]
-            sentiment_idx = np.argmax(scores)
-            
-            return {
-                "label": labels[sentiment_idx],
-                "score": float(scores[sentiment_idx]),
-                "negative": float(scores[0]),
-                "neutral": float(scores[1]),
-                "positive": float(scores[2]),
-                "compound_score": float(scores[2] - scores[0])  # -1 to 1
-            }
+            scores = self.sentiment_model.predict_proba(texts)
+            return [self._sentiment_from_scores(row) for row in scores]
         except Exception as e:
             logger.error(f"Sentiment analysis error: {e}")
-            return {"label": "neutral", "score": 0.5, "compound_score": 0.0}
+            return [{"label": "neutral", "score": 0.5, "compound_score": 0.0} for _ in texts]
+    
+    def _sentiment_from_scores(self, scores: np.ndarray) -> Dict[str, float]:
+        """Map softmax scores of one text to sentiment labels"""
+        labels = ["negative", "neutral", "positive"]
+        sentiment_idx = np.argmax(scores)
+        
+        return {
+            "label": labels[sentiment_idx],
+            "score": float(scores[sentiment_idx]),
+            "negative": float(scores[0]),
+            "neutral": float(scores[1]),
+            "positive": float(scores[2]),
+            "compound_score": float(scores[2] - scores[0])  # -1 to 1
+        }
     
     def detect_emotion(self, text: str) -> Dict[str, float]:
         """
         Detect emotions in text
         Returns: Dictionary of emotion scores
         """
-        if not self.emotion_pipeline:
-            return {}
+        return self._run_single("emotion", self.detect_emotion_batch, text)
+    
+    def detect_emotion_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        """
+        Detect emotions for several texts with one pipeline call
+        Returns: One emotion dict per text, same shape as detect_emotion
+        """
+        if not self.emotion_model:
+            return [{} for _ in texts]
+        
+        if not texts:
+            return []
         
         try:
-            results = self.emotion_pipeline(text[:512])[0]  # Truncate long text
-            emotion_scores = {item['label']: item['score'] for item in results}
-            
-            # Get dominant emotion
-            dominant_emotion = max(emotion_scores.items(), key=lambda x: x[1])
+            scores = self.emotion_model.predict_proba(texts)
+            labels = self.emotion_model.labels
             
-            return {
-                "dominant": dominant_emotion[0],
-                "scores": emotion_scores
-            }
+            emotions = []
+            for row in scores:
+                emotion_scores = {label: float(score) for label, score in zip(labels, row)}
+                
+                # Get dominant emotion
+                dominant_emotion = max(emotion_scores.items(), key=lambda x: x[1])
+                
+                emotions.append({
+                    "dominant": dominant_emotion[0],
+                    "scores": emotion_scores
+                })
+            return emotions
         except Exception as e:
             logger.error(f"Emotion detection error: {e}")
-            return {"dominant": "neutral", "scores": {}}
+            return [{"dominant": "neutral", "scores": {}} for _ in texts]
     
     def calculate_urgency(self, text: str, sentiment: Dict) -> Tuple[int, str]:
         """
@@ -165,15 +358,22 @@ class AIAnalyzer:
     
     def generate_embedding(self, text: str) -> List[float]:
         """Generate vector embedding for text"""
+        return self._run_single("embedding", self.generate_embedding_batch, text)
+    
+    def generate_embedding_batch(self, texts: List[str]) -> List[List[float]]:
+        """Generate vector embeddings for several texts with one encode call"""
         if not self.embedding_model:
+            return [[] for _ in texts]
+        
+        if not texts:
             return []
         
         try:
-            embedding = self.embedding_model.encode(text, convert_to_numpy=True)
-            return embedding.tolist()
+            embeddings = self.embedding_model.encode(texts)
+            return [embedding.tolist() for embedding in embeddings]
         except Exception as e:
             logger.error(f"Embedding generation error: {e}")
-            return []
+            return [[] for _ in texts]
     
     def extract_keywords(self, text: str, top_n: int = 10) -> List[str]:
         """Extract important keywords from text"""
@@ -272,18 +472,61 @@ class AIAnalyzer:
         Comprehensive feedback analysis
         Returns all analysis results
         """
-        # Sentiment analysis
-        sentiment = self.analyze_sentiment(text)
+        cache = get_analysis_cache()
+        outputs = cache.get_many([text], self.cache_fingerprint)[0] if cache else None
+        
+        if outputs is None:
+            outputs = self.model_outputs_batch([text])[0]
+            if cache:
+                cache.put_many([text], [outputs], self.cache_fingerprint)
+        
+        return self._build_analysis(text, *outputs)
+    
+    def analyze_feedback_batch(self, texts: List[str], batch_size: int = None) -> List[Dict]:
+        """
+        Comprehensive analysis for many feedback texts
         
-        # Emotion detection
-        emotion = self.detect_emotion(text)
+        Each model runs once per micro-batch of `batch_size` texts instead of
+        once per text. Cached texts and repeats within the batch skip the
+        models, and the rest are grouped by token length before batching to
+        keep padding low. Returns one result per text, in input order, with
+        the same shape as analyze_feedback.
+        """
+        batch_size = batch_size or settings.ANALYSIS_BATCH_SIZE
+        
+        cache = get_analysis_cache()
+        outputs = cache.get_many(texts, self.cache_fingerprint) if cache else [None] * len(texts)
+        
+        # Texts that normalize the same run through the models once
+        pending: Dict[str, List[int]] = {}
+        for i, output in enumerate(outputs):
+            if output is None:
+                pending.setdefault(normalize_text(texts[i]), []).append(i)
+        unique = [indices[0] for indices in pending.values()]
+        
+        order = sorted(unique, key=lambda i: self._token_length(texts[i]))
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            batch = [texts[i] for i in indices]
+            
+            for i, output in zip(indices, self.model_outputs_batch(batch)):
+                outputs[i] = output
+            if cache:
+                cache.put_many(batch, [outputs[i] for i in indices], self.cache_fingerprint)
+        
+        for indices in pending.values():
+            for i in indices[1:]:
+                outputs[i] = outputs[indices[0]]
         
+        return [self._build_analysis(text, *output) for text, output in zip(texts, outputs)]
+    
+    def _build_analysis(self, text: str, sentiment: Dict, emotion: Dict, embedding: List[float]) -> Dict:
+        """
+        Combine model outputs with the rule-based signals for one text
+        """
         # Urgency calculation
         urgency_score, urgency_level = self.calculate_urgency(text, sentiment)
         
-        # Embedding generation
-        embedding = self.generate_embedding(text)
-        
         # Keyword extraction
         keywords = self.extract_keywords(text)
         
@@ -319,12 +562,63 @@ class AIAnalyzer:
         }
 
 
+class RemoteAIAnalyzer(AIAnalyzer):
+    """
+    AIAnalyzer whose models run in the inference server
+    
+    Same interface as AIAnalyzer. The three model calls go over the socket
+    and are batched with every other caller's; the rule-based signals and
+    the analysis cache stay in this process. Server failures raise
+    InferenceServerError rather than falling back, so callers retry
+    instead of storing placeholder results.
+    """
+    
+    def __init__(self, socket_path: str):
+        from app.services.inference_server import InferenceClient
+        
+        self.client = InferenceClient(socket_path)
+        self.batchers: Dict[str, LengthBucketedBatcher] = {}
+        logger.info(f"Using inference server at {socket_path}")
+    
+    @property
+    def cache_fingerprint(self) -> str:
+        # Read after each call, so outputs of a restarted server go under its models' key
+        if self.client.variants is None:
+            self.client.call("ping", [])
+        return model_fingerprint(self.client.variants)
+    
+    def _token_length(self, text: str) -> int:
+        # Only orders micro-batches here; the server buckets by real token length
+        return len(text.split())
+    
+    def _call(self, op: str, texts: List[str]) -> List:
+        if not texts:
+            return []
+        return self.client.call(op, texts)
+    
+    def analyze_sentiment_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        return self._call("sentiment", texts)
+    
+    def detect_emotion_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        return self._call("emotion", texts)
+    
+    def generate_embedding_batch(self, texts: List[str]) -> List[List[float]]:
+        return self._call("embedding", texts)
+    
+    def model_outputs_batch(self, texts: List[str]) -> List[Tuple[Dict, Dict, List[float]]]:
+        # One round trip; the server tokenizes each text once for all three models
+        return [tuple(output) for output in self._call("analyze", texts)]
+
+
 # Singleton instance
 _ai_analyzer = None
 
 def get_ai_analyzer() -> AIAnalyzer:
-    """Get or create AI analyzer instance"""
+    """Get or create AI analyzer instance, a client of the inference server when one is configured"""
     global _ai_analyzer
     if _ai_analyzer is None:
-        _ai_analyzer = AIAnalyzer()
+        if settings.INFERENCE_SERVER_SOCKET:
+            _ai_analyzer = RemoteAIAnalyzer(settings.INFERENCE_SERVER_SOCKET)
+        else:
+            _ai_analyzer = AIAnalyzer()
     return _ai_analyzer
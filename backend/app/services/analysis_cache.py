@@ -0,0 +1,258 @@
+"""
+Analysis Result Cache
+Content-addressed cache of model outputs: an in-process LRU in front of Redis
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+
+import numpy as np
+import redis
+
+from app.core.cache import get_sync_redis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "analysis:cache"
+INDEX_KEY = f"{KEY_PREFIX}:index"  # Sorted set of entry keys by last write
+SIZES_KEY = f"{KEY_PREFIX}:sizes"  # Entry key -> stored bytes
+BYTES_KEY = f"{KEY_PREFIX}:bytes"  # Total stored bytes
+STATS_KEY = f"{KEY_PREFIX}:stats"  # Hit counters across all processes
+STATS_FLUSH_SECONDS = 10  # How often a process adds its hit counts to STATS_KEY
+
+# Store entries and add only the change in size to the byte total, so rewriting
+# a key (two workers missing on the same text) doesn't count it twice.
+# KEYS: index, sizes, bytes, entry keys...; ARGV: timestamp, values...
+_PUT_SCRIPT = """
+local delta = 0
+for i = 4, #KEYS do
+    local value = ARGV[i - 2]
+    local previous = tonumber(redis.call('HGET', KEYS[2], KEYS[i]) or '0')
+    redis.call('SET', KEYS[i], value)
+    redis.call('HSET', KEYS[2], KEYS[i], string.len(value))
+    redis.call('ZADD', KEYS[1], ARGV[1], KEYS[i])
+    delta = delta + string.len(value) - previous
+end
+return redis.call('INCRBY', KEYS[3], delta)
+"""
+
+
+def normalize_text(text: str) -> str:
+    """
+    Text as seen by the cache key
+    
+    Unicode-normalized with whitespace collapsed. Case is kept because the
+    sentiment model is case-sensitive ("CRASHES" scores differently).
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def model_fingerprint(variants: List[str]) -> str:
+    """
+    Identifies the models whose outputs are cached; any change starts a fresh keyspace
+    
+    Args:
+        variants: Backend and precision each model actually loaded with,
+            which differ from the settings when an export or int8
+            validation is missing and the model falls back
+    """
+    parts = [
+        settings.SENTIMENT_MODEL,
+        settings.EMOTION_MODEL,
+        settings.EMBEDDING_MODEL,
+        settings.INFERENCE_BACKEND,
+        *variants,
+        settings.ANALYSIS_CACHE_VERSION,
+    ]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of (sentiment, emotion, embedding) per normalized text
+    
+    Entries are keyed by the model_fingerprint of the analyzer that
+    computed them, passed with every call. Lookups try the process-local LRU, then Redis. Redis holds at most
+    ANALYSIS_CACHE_MAX_BYTES; the least recently written entries are
+    evicted past that. Redis errors degrade to the local tier.
+    """
+    
+    def __init__(self, lru_size: int = None, max_bytes: int = None):
+        self.lru_size = lru_size or settings.ANALYSIS_CACHE_LRU_SIZE
+        self.max_bytes = max_bytes or settings.ANALYSIS_CACHE_MAX_BYTES
+        self._lru: "OrderedDict[str, Tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"lru_hits": 0, "shared_hits": 0, "misses": 0}
+        self._unflushed = dict.fromkeys(self.stats, 0)
+        self._last_flush = time.monotonic()
+    
+    def key(self, text: str, fingerprint: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode()).hexdigest()
+        return f"{KEY_PREFIX}:{fingerprint}:{digest}"
+    
+    def get_many(self, texts: List[str], fingerprint: str) -> List[Optional[Tuple[Dict, Dict, List[float]]]]:
+        """Cached (sentiment, emotion, embedding) per text, None on a miss"""
+        keys = [self.key(text, fingerprint) for text in texts]
+        results = [None] * len(texts)
+        
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    results[i] = self._lru[key]
+        
+        lru_hits = sum(result is not None for result in results)
+        missing = [i for i, result in enumerate(results) if result is None]
+        
+        shared_hits = 0
+        if missing:
+            try:
+                values = get_sync_redis().mget([keys[i] for i in missing])
+            except redis.RedisError as e:
+                logger.warning(f"Analysis cache unavailable: {e}")
+                values = [None] * len(missing)
+            
+            for i, value in zip(missing, values):
+                if value is not None:
+                    results[i] = _decode(value)
+                    self._remember(keys[i], results[i])
+                    shared_hits += 1
+        
+        self._count(lru_hits, shared_hits, len(texts) - lru_hits - shared_hits)
+        return results
+    
+    def put_many(self, texts: List[str], outputs: List[Tuple[Dict, Dict, List[float]]], fingerprint: str):
+        """Store model outputs; outputs from a failed model call are not cached"""
+        entries = {}
+        for text, output in zip(texts, outputs):
+            if not _is_complete(*output):
+                continue
+            key = self.key(text, fingerprint)
+            self._remember(key, output)
+            entries[key] = _encode(*output)
+        
+        if not entries:
+            return
+        
+        try:
+            client = get_sync_redis()
+            put = client.register_script(_PUT_SCRIPT)
+            total = put(keys=[INDEX_KEY, SIZES_KEY, BYTES_KEY, *entries], args=[time.time(), *entries.values()])
+            
+            if total > self.max_bytes:
+                self._evict(client, total)
+        except redis.RedisError as e:
+            logger.warning(f"Analysis cache unavailable: {e}")
+    
+    def _evict(self, client: redis.Redis, total: int):
+        """Drop the oldest shared entries until the tier is back under 90% of its budget"""
+        target = int(self.max_bytes * 0.9)
+        while total > target:
+            oldest = [key for key, _ in client.zpopmin(INDEX_KEY, 256)]
+            if not oldest:
+                break
+            
+            freed = sum(int(size or 0) for size in client.hmget(SIZES_KEY, oldest))
+            pipe = client.pipeline(transaction=False)
+            pipe.delete(*oldest)
+            pipe.hdel(SIZES_KEY, *oldest)
+            pipe.decrby(BYTES_KEY, freed)
+            total = pipe.execute()[-1]
+    
+    def _remember(self, key: str, output: Tuple):
+        with self._lock:
+            self._lru[key] = output
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+    
+    def _count(self, lru_hits: int, shared_hits: int, misses: int):
+        with self._lock:
+            for name, count in (("lru_hits", lru_hits), ("shared_hits", shared_hits), ("misses", misses)):
+                self.stats[name] += count
+                self._unflushed[name] += count
+            due = time.monotonic() - self._last_flush >= STATS_FLUSH_SECONDS
+        
+        if due:
+            self.flush_stats()
+    
+    def flush_stats(self):
+        """Add the counts since the last flush to the shared stats"""
+        with self._lock:
+            counts, self._unflushed = self._unflushed, dict.fromkeys(self.stats, 0)
+            self._last_flush = time.monotonic()
+        
+        try:
+            pipe = get_sync_redis().pipeline(transaction=False)
+            for name, count in counts.items():
+                if count:
+                    pipe.hincrby(STATS_KEY, name, count)
+            pipe.execute()
+        except redis.RedisError:
+            pass  # Shared stats are best effort; these counts are dropped
+
+
+def _is_complete(sentiment: Dict, emotion: Dict, embedding: List[float]) -> bool:
+    # Error fallbacks lack the per-class sentiment scores, emotion scores or embedding
+    return "positive" in sentiment and bool(emotion.get("scores")) and len(embedding) > 0
+
+
+def _encode(sentiment: Dict, emotion: Dict, embedding: List[float]) -> bytes:
+    # Embedding as base64 float32, a quarter the size of a JSON float list
+    packed = base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode()
+    return json.dumps({"sentiment": sentiment, "emotion": emotion, "embedding": packed}).encode()
+
+
+def _decode(value: bytes) -> Tuple[Dict, Dict, List[float]]:
+    data = json.loads(value)
+    embedding = np.frombuffer(base64.b64decode(data["embedding"]), dtype=np.float32).tolist()
+    return data["sentiment"], data["emotion"], embedding
+
+
+def _hit_rates(counts: Dict[str, int]) -> Dict[str, float]:
+    lookups = sum(counts.values())
+    return {
+        **counts,
+        "lookups": lookups,
+        "hit_rate": (counts["lru_hits"] + counts["shared_hits"]) / lookups if lookups else 0.0,
+        "lru_hit_rate": counts["lru_hits"] / lookups if lookups else 0.0,
+    }
+
+
+def analysis_cache_stats() -> Dict:
+    """Hit counts and rates for this process and across all workers"""
+    stats = {"enabled": settings.ANALYSIS_CACHE_ENABLED}
+    if _analysis_cache is not None:
+        stats["process"] = _hit_rates(dict(_analysis_cache.stats))
+        _analysis_cache.flush_stats()
+    
+    try:
+        client = get_sync_redis()
+        shared = client.hgetall(STATS_KEY)
+        stats["all_workers"] = _hit_rates({
+            name: int(shared.get(name.encode(), 0)) for name in ("lru_hits", "shared_hits", "misses")
+        })
+        stats["shared_bytes"] = int(client.get(BYTES_KEY) or 0)
+    except redis.RedisError as e:
+        stats["error"] = str(e)
+    
+    return stats
+
+
+# Singleton instance
+_analysis_cache = None
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """Get or create the analysis cache, None when disabled"""
+    global _analysis_cache
+    if _analysis_cache is None and settings.ANALYSIS_CACHE_ENABLED:
+        _analysis_cache = AnalysisCache()
+    return _analysis_cache
@@ -0,0 +1,203 @@
+"""
+Daily Analytics Rollups
+Keeps per (tenant, day, source, channel) counters of analyzed feedback in step
+with the feedbacks table, so dashboards don't rescan raw rows
+"""
+
+from sqlalchemy import select, delete, func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+from app.core.database import AsyncSessionLocal
+from app.models import Feedback, FeedbackDailyRollup, SentimentEnum, UrgencyLevel
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COLUMNS = [
+    "total_count",
+    *[f"{sentiment.value}_count" for sentiment in SentimentEnum],
+    *[f"{level.value}_count" for level in UrgencyLevel],
+    "sentiment_sum",
+    "sentiment_count",
+    "feature_request_count",
+    "bug_report_count",
+]
+
+
+def _value(enum_or_str) -> Optional[str]:
+    return getattr(enum_or_str, "value", enum_or_str)
+
+
+def rollup_key(feedback) -> Tuple:
+    """Rollup row a feedback item counts towards"""
+    return (
+        feedback.tenant_id,
+        feedback.created_at.date(),
+        feedback.source or "",
+        feedback.channel or "",
+    )
+
+
+def rollup_contribution(values: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Counters one analyzed feedback item adds to its rollup row
+    
+    Args:
+        values: Analysis column values (sentiment, sentiment_score,
+            urgency_level, is_feature_request, is_bug_report)
+    """
+    contribution = {"total_count": 1}
+    
+    sentiment = _value(values.get("sentiment"))
+    if sentiment:
+        contribution[f"{sentiment}_count"] = 1
+    
+    urgency_level = _value(values.get("urgency_level"))
+    if urgency_level:
+        contribution[f"{urgency_level}_count"] = 1
+    
+    if values.get("sentiment_score") is not None:
+        contribution["sentiment_sum"] = float(values["sentiment_score"])
+        contribution["sentiment_count"] = 1
+    
+    if values.get("is_feature_request"):
+        contribution["feature_request_count"] = 1
+    if values.get("is_bug_report"):
+        contribution["bug_report_count"] = 1
+    
+    return contribution
+
+
+def analyzed_values(feedback) -> Optional[Dict[str, Any]]:
+    """Current analysis values of a feedback row, or None if never analyzed"""
+    if feedback.analyzed_at is None:
+        return None
+    return {
+        "sentiment": feedback.sentiment,
+        "sentiment_score": feedback.sentiment_score,
+        "urgency_level": feedback.urgency_level,
+        "is_feature_request": feedback.is_feature_request,
+        "is_bug_report": feedback.is_bug_report,
+    }
+
+
+class RollupDelta:
+    """Accumulates counter changes per rollup row before one upsert"""
+    
+    def __init__(self):
+        self.rows: Dict[Tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    
+    def add(self, feedback, values: Optional[Dict[str, Any]], sign: int = 1):
+        """Add (sign=1) or remove (sign=-1) one item's analysis values"""
+        if values is None:
+            return
+        row = self.rows[rollup_key(feedback)]
+        for column, amount in rollup_contribution(values).items():
+            row[column] += sign * amount
+    
+    def replace(self, feedback, old_values: Optional[Dict[str, Any]], new_values: Dict[str, Any]):
+        """Swap an item's previous analysis for a new one"""
+        self.add(feedback, old_values, sign=-1)
+        self.add(feedback, new_values, sign=1)
+    
+    async def apply(self, session: AsyncSession):
+        """Upsert all accumulated changes in one statement; does not commit"""
+        rows = [
+            {
+                "tenant_id": tenant_id,
+                "day": day,
+                "source": source,
+                "channel": channel,
+                **{column: counters.get(column, 0) for column in COUNTER_COLUMNS},
+            }
+            for (tenant_id, day, source, channel), counters in self.rows.items()
+            if any(counters.values())
+        ]
+        if not rows:
+            return
+        
+        statement = insert(FeedbackDailyRollup).values(rows)
+        table = FeedbackDailyRollup.__table__
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.tenant_id, table.c.day, table.c.source, table.c.channel],
+            set_={
+                **{column: table.c[column] + statement.excluded[column] for column in COUNTER_COLUMNS},
+                "updated_at": datetime.utcnow(),
+            }
+        )
+        await session.execute(statement)
+        self.rows.clear()
+
+
+async def rebuild_rollups(session: AsyncSession, tenant_id=None) -> int:
+    """
+    Recompute rollup rows from the feedbacks table
+    
+    Used for backfills and to repair drift. Does not commit.
+    
+    Returns:
+        Number of rollup rows written
+    """
+    delete_statement = delete(FeedbackDailyRollup)
+    if tenant_id is not None:
+        delete_statement = delete_statement.where(FeedbackDailyRollup.tenant_id == tenant_id)
+    await session.execute(delete_statement)
+    
+    # Literal '' so the grouped expressions match the selected ones exactly
+    empty = literal_column("''")
+    day = func.date(Feedback.created_at)
+    source = func.coalesce(Feedback.source, empty)
+    channel = func.coalesce(Feedback.channel, empty)
+    
+    count = func.count(Feedback.id)
+    aggregates = select(
+        Feedback.tenant_id,
+        day,
+        source,
+        channel,
+        count,
+        *[count.filter(Feedback.sentiment == sentiment) for sentiment in SentimentEnum],
+        *[count.filter(Feedback.urgency_level == level) for level in UrgencyLevel],
+        func.coalesce(func.sum(Feedback.sentiment_score), 0.0),
+        func.count(Feedback.sentiment_score),
+        count.filter(Feedback.is_feature_request == True),
+        count.filter(Feedback.is_bug_report == True),
+        literal_column("now() at time zone 'utc'"),
+    ).where(
+        Feedback.analyzed_at.isnot(None)
+    ).group_by(Feedback.tenant_id, day, source, channel)
+    if tenant_id is not None:
+        aggregates = aggregates.where(Feedback.tenant_id == tenant_id)
+    
+    result = await session.execute(
+        insert(FeedbackDailyRollup).from_select(
+            ["tenant_id", "day", "source", "channel", *COUNTER_COLUMNS, "updated_at"],
+            aggregates
+        )
+    )
+    return result.rowcount
+
+
+async def _rebuild_command(tenant_id: Optional[str] = None):
+    async with AsyncSessionLocal() as db:
+        try:
+            rows = await rebuild_rollups(db, tenant_id)
+            await db.commit()
+            logger.info(f"✅ Rebuilt {rows} daily analytics rollup rows")
+        except Exception as e:
+            logger.error(f"❌ Error rebuilding daily analytics rollups: {e}")
+            await db.rollback()
+            raise
+
+
+if __name__ == "__main__":
+    # python -m app.services.analytics_rollup [tenant_id]
+    import asyncio
+    import sys
+    
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_rebuild_command(sys.argv[1] if len(sys.argv) > 1 else None))
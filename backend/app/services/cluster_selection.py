@@ -0,0 +1,128 @@
+"""
+Cluster Count Selection
+Chooses k for topic clustering on a subsample within a fixed time budget
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+import logging
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def select_cluster_count(embeddings: np.ndarray, max_k: int, min_k: int = 2) -> int:
+    """
+    Pick the number of clusters between min_k and max_k
+    
+    Every candidate is fitted once on the same random subsample, in
+    parallel threads, in coarse-to-fine order so that a cut-off by
+    CLUSTER_SELECTION_TIME_BUDGET still leaves the whole range covered.
+    The winner is the best silhouette on a smaller sample, or the knee of
+    the inertia curve with CLUSTER_SELECTION_METHOD = "kneedle".
+    """
+    if max_k <= min_k:
+        return min_k
+    
+    from joblib import Parallel, delayed
+    
+    rng = np.random.default_rng(42)
+    sample = embeddings
+    if len(sample) > settings.CLUSTER_SELECTION_SAMPLE_SIZE:
+        sample = sample[rng.choice(len(sample), settings.CLUSTER_SELECTION_SAMPLE_SIZE, replace=False)]
+    
+    silhouette_idx = np.arange(len(sample))
+    if len(sample) > settings.CLUSTER_SELECTION_SILHOUETTE_SAMPLE:
+        silhouette_idx = rng.choice(len(sample), settings.CLUSTER_SELECTION_SILHOUETTE_SAMPLE, replace=False)
+    
+    candidates = _coarse_to_fine(list(range(min_k, max_k + 1)))
+    n_jobs = max(1, settings.CLUSTER_SELECTION_N_JOBS)
+    deadline = time.monotonic() + settings.CLUSTER_SELECTION_TIME_BUDGET
+    
+    scores: Dict[int, Tuple[float, Optional[float]]] = {}
+    with Parallel(n_jobs=n_jobs, prefer="threads") as parallel:
+        for start in range(0, len(candidates), n_jobs):
+            if scores and time.monotonic() >= deadline:
+                logger.info(f"Cluster selection budget reached after {len(scores)}/{len(candidates)} candidates")
+                break
+            
+            wave = candidates[start:start + n_jobs]
+            for k, inertia, silhouette in parallel(
+                delayed(_evaluate_k)(sample, k, silhouette_idx) for k in wave
+            ):
+                scores[k] = (inertia, silhouette)
+    
+    ks = sorted(scores)
+    silhouettes = [scores[k][1] for k in ks]
+    
+    if settings.CLUSTER_SELECTION_METHOD == "kneedle" or all(s is None for s in silhouettes):
+        best_k = kneedle(ks, [scores[k][0] for k in ks])
+    else:
+        # Highest silhouette; the smaller k wins ties
+        best_k = max(ks, key=lambda k: (scores[k][1] if scores[k][1] is not None else -1.0, -k))
+    
+    logger.info(f"Selected k={best_k} from {len(ks)} candidates on {len(sample)} samples")
+    return best_k
+
+
+def kneedle(ks: List[int], inertias: List[float]) -> int:
+    """
+    Knee of a decreasing inertia curve (Satopaa et al. kneedle)
+    
+    Both axes are scaled to [0, 1]; the knee is the point farthest above
+    the straight line joining the first and last candidates.
+    """
+    if len(ks) < 3:
+        return ks[0]
+    
+    x = np.asarray(ks, dtype=float)
+    y = np.asarray(inertias, dtype=float)
+    
+    x_norm = (x - x.min()) / (x.max() - x.min())
+    y_range = y.max() - y.min()
+    if y_range == 0:
+        return ks[0]
+    y_norm = (y.max() - y) / y_range  # Flip to an increasing concave curve
+    
+    return ks[int(np.argmax(y_norm - x_norm))]
+
+
+def _evaluate_k(sample: np.ndarray, k: int, silhouette_idx: np.ndarray) -> Tuple[int, float, Optional[float]]:
+    """Fit one candidate and score it by inertia and sampled silhouette"""
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import silhouette_score
+    
+    kmeans = MiniBatchKMeans(
+        n_clusters=k,
+        n_init=1,
+        batch_size=settings.CLUSTERING_BATCH_SIZE,
+        random_state=42
+    )
+    labels = kmeans.fit_predict(sample)
+    
+    silhouette = None
+    sample_labels = labels[silhouette_idx]
+    if len(np.unique(sample_labels)) > 1:
+        silhouette = float(silhouette_score(sample[silhouette_idx], sample_labels))
+    
+    return k, float(kmeans.inertia_), silhouette
+
+
+def _coarse_to_fine(candidates: List[int]) -> List[int]:
+    """Order candidates so every prefix spreads across the whole range"""
+    ordered = []
+    seen = set()
+    stride = 1
+    while stride * 2 < len(candidates):
+        stride *= 2
+    
+    while stride >= 1:
+        for k in candidates[::stride] + candidates[-1:]:
+            if k not in seen:
+                seen.add(k)
+                ordered.append(k)
+        stride //= 2
+    
+    return ordered
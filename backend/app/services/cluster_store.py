@@ -0,0 +1,328 @@
+"""
+Cluster Persistence
+Runs clustering for a tenant and keeps the FeedbackCluster tables up to date
+"""
+
+from sqlalchemy import select, insert, update, delete, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import uuid
+
+import numpy as np
+
+from app.core.config import settings
+from app.models import Feedback, FeedbackCluster, FeedbackClusterAssociation
+from app.services.clustering_service import get_clustering_service
+from app.services.embedding_loader import load_embeddings
+
+logger = logging.getLogger(__name__)
+
+MIN_FEEDBACK_FOR_CLUSTERING = 5
+
+
+def clustering_cache_key(tenant_id) -> str:
+    """Redis key of a tenant's last clustering result"""
+    return f"clustering:result:{tenant_id}"
+
+
+def refit_lock_key(tenant_id) -> str:
+    """Redis key held while a drift-triggered re-fit of the tenant is queued or running"""
+    return f"clustering:refit-queued:{tenant_id}"
+
+
+async def embedding_set_version(session: AsyncSession, tenant_id) -> Tuple[int, str]:
+    """
+    Count and version of a tenant's clusterable embeddings
+    
+    The version changes whenever feedback is analyzed, re-analyzed or
+    deleted, so a cached clustering result is valid while it matches.
+    """
+    result = await session.execute(
+        select(func.count(Feedback.id), func.max(Feedback.analyzed_at)).where(
+            Feedback.tenant_id == tenant_id,
+            Feedback.analyzed_at.isnot(None),
+            Feedback.embedding.isnot(None)
+        )
+    )
+    count, latest = result.one()
+    return count, f"{count}:{latest.isoformat() if latest else ''}"
+
+
+async def load_clusters(session: AsyncSession, tenant_id) -> List[FeedbackCluster]:
+    """Current clusters of a tenant, ordered by label"""
+    result = await session.execute(
+        select(FeedbackCluster).where(
+            FeedbackCluster.tenant_id == tenant_id
+        ).order_by(FeedbackCluster.label)
+    )
+    return list(result.scalars().all())
+
+
+async def lock_clusters(session: AsyncSession, tenant_ids) -> None:
+    """
+    Lock the cluster rows of tenants until the transaction ends
+    
+    Analyses, deletes and re-fits take this lock before touching any
+    feedback or membership row of the tenant, so their counter updates
+    serialize per tenant and always lock in the same order.
+    """
+    await session.execute(
+        select(FeedbackCluster.id).where(
+            FeedbackCluster.tenant_id.in_(list(tenant_ids))
+        ).order_by(FeedbackCluster.id).with_for_update()
+    )
+
+
+async def remove_cluster_member(session: AsyncSession, cluster_id, sentiment_score: Optional[float]) -> None:
+    """Take one deleted member out of a cluster's size and sentiment mean. Does not commit."""
+    values = {"size": func.greatest(FeedbackCluster.size - 1, 0)}
+    if sentiment_score is not None:
+        remaining = FeedbackCluster.scored_size - 1
+        values["scored_size"] = func.greatest(remaining, 0)
+        values["avg_sentiment"] = case(
+            (remaining > 0, (FeedbackCluster.avg_sentiment * FeedbackCluster.scored_size - sentiment_score) / remaining),
+            else_=None
+        )
+    
+    await session.execute(
+        update(FeedbackCluster).where(FeedbackCluster.id == cluster_id).values(**values)
+    )
+
+
+async def recluster_tenant(
+    session: AsyncSession,
+    tenant_id,
+    n_clusters: int = None,
+    warm_start: bool = True,
+    progress: Optional[Callable[[str, float], None]] = None
+) -> Dict[str, Any]:
+    """
+    Cluster all analyzed feedback of a tenant and replace its stored clusters
+    
+    With warm_start, the previous run's centroids seed MiniBatchKMeans so
+    a scheduled re-fit only refines the existing topics. `progress` is
+    called with (stage, fraction done). Does not commit.
+    
+    Raises:
+        ValueError: Not enough analyzed feedback to cluster
+    """
+    progress = progress or (lambda stage, fraction: None)
+    progress("loading", 0.0)
+    
+    rows, embeddings = await load_embeddings(
+        session,
+        tenant_id,
+        columns=[Feedback.text, Feedback.sentiment_score, Feedback.created_at],
+        where=[Feedback.analyzed_at.isnot(None)]
+    )
+    
+    if len(rows) < MIN_FEEDBACK_FOR_CLUSTERING:
+        raise ValueError(
+            f"Not enough analyzed feedback for clustering (minimum {MIN_FEEDBACK_FOR_CLUSTERING} required)"
+        )
+    
+    init_centroids = None
+    if warm_start:
+        previous = await load_clusters(session, tenant_id)
+        init_centroids = [cluster.centroid for cluster in previous if cluster.centroid is not None] or None
+    
+    progress("clustering", 0.2)
+    clustering = get_clustering_service().cluster_feedback(
+        embeddings=embeddings,
+        texts=[row.text for row in rows],
+        n_clusters=n_clusters,
+        init_centroids=init_centroids
+    )
+    
+    progress("saving", 0.8)
+    await _replace_clusters(session, tenant_id, rows, clustering)
+    progress("done", 1.0)
+    
+    logger.info(
+        f"Clustered {len(rows)} feedback items for tenant {tenant_id} "
+        f"into {clustering['n_clusters']} clusters (warm start: {clustering['warm_started']})"
+    )
+    
+    return {
+        "items_clustered": len(rows),
+        "n_clusters": clustering["n_clusters"],
+        "clusters": clustering["clusters"]
+    }
+
+
+def cluster_trend(recent_size: int, previous_size: int) -> Optional[float]:
+    """Relative change in new members between two trend windows; None for a topic with no history"""
+    if not previous_size:
+        return None
+    return (recent_size - previous_size) / previous_size
+
+
+async def _replace_clusters(session: AsyncSession, tenant_id, rows, clustering: Dict):
+    """Swap the tenant's clusters and memberships for a new clustering result"""
+    await lock_clusters(session, [tenant_id])
+    
+    tenant_clusters = select(FeedbackCluster.id).where(FeedbackCluster.tenant_id == tenant_id)
+    await session.execute(
+        delete(FeedbackClusterAssociation).where(FeedbackClusterAssociation.cluster_id.in_(tenant_clusters))
+    )
+    await session.execute(delete(FeedbackCluster).where(FeedbackCluster.tenant_id == tenant_id))
+    
+    labels = np.asarray(clustering["labels"])
+    sentiments = np.array([
+        row.sentiment_score if row.sentiment_score is not None else np.nan for row in rows
+    ], dtype=float)
+    
+    # Trend windows are anchored at fit time; assignments until the next fit count as recent
+    window = timedelta(days=settings.CLUSTER_TREND_DAYS)
+    created = np.array([row.created_at for row in rows], dtype="datetime64[us]")
+    recent_start = np.datetime64(datetime.utcnow() - window, "us")
+    previous_start = recent_start - np.timedelta64(window)
+    
+    cluster_ids = []
+    cluster_rows = []
+    for cluster in clustering["clusters"]:
+        label = cluster["id"]
+        member_sentiments = sentiments[labels == label]
+        has_sentiment = member_sentiments.size and not np.isnan(member_sentiments).all()
+        member_created = created[labels == label]
+        recent_size = int((member_created >= recent_start).sum())
+        previous_size = int(((member_created >= previous_start) & (member_created < recent_start)).sum())
+        
+        cluster_id = uuid.uuid4()
+        cluster_ids.append(cluster_id)
+        cluster_rows.append({
+            "id": cluster_id,
+            "tenant_id": tenant_id,
+            "label": label,
+            "name": ", ".join(cluster["keywords"][:3]) or f"Cluster {label}",
+            "size": cluster["size"],
+            "avg_sentiment": float(np.nanmean(member_sentiments)) if has_sentiment else None,
+            "scored_size": int(np.count_nonzero(~np.isnan(member_sentiments))),
+            "top_keywords": cluster["keywords"],
+            "representative_texts": cluster["representative_texts"],
+            "centroid": clustering["centroids"][label],
+            "radius": clustering["radii"][label],
+            "assigned_since_fit": 0,
+            "outliers_since_fit": 0,
+            "recent_size": recent_size,
+            "previous_size": previous_size,
+            "trend": cluster_trend(recent_size, previous_size)
+        })
+    
+    await session.execute(insert(FeedbackCluster), cluster_rows)
+    
+    await session.execute(
+        insert(FeedbackClusterAssociation),
+        [
+            {"feedback_id": row.id, "cluster_id": cluster_ids[label], "similarity_score": similarity}
+            for row, label, similarity in zip(rows, clustering["labels"], clustering["similarities"])
+        ]
+    )
+    
+    # Cluster topic on the feedback itself, read by list filters and the UI
+    await session.execute(
+        update(Feedback),
+        [
+            {"id": row.id, "topics": [f"cluster_{label}"]}
+            for row, label in zip(rows, clustering["labels"])
+        ]
+    )
+
+
+async def assign_new_feedback(session: AsyncSession, items: List[Tuple]) -> List:
+    """
+    Assign freshly analyzed feedback to the existing clusters of its tenant
+    
+    Runs in the transaction that writes the analysis, before the new
+    sentiment scores are, so members leaving a cluster take their previous
+    score out of its mean. The tenants' clusters stay locked until commit.
+    
+    Args:
+        items: (tenant_id, feedback_id, embedding, sentiment_score) tuples
+    
+    Returns:
+        Tenants whose share of outliers since the last fit exceeds
+        CLUSTERING_DRIFT_THRESHOLD and should be fully re-clustered.
+        Does not commit.
+    """
+    by_tenant = defaultdict(list)
+    for tenant_id, feedback_id, embedding, sentiment_score in items:
+        if embedding is not None and len(embedding):
+            by_tenant[tenant_id].append((feedback_id, embedding, sentiment_score))
+    
+    # Counters are read, updated and written back; concurrent batches of a tenant wait here
+    await lock_clusters(session, by_tenant)
+    
+    drifted = []
+    for tenant_id, entries in by_tenant.items():
+        clusters = [cluster for cluster in await load_clusters(session, tenant_id) if cluster.centroid is not None]
+        if not clusters:
+            continue
+        
+        feedback_ids = [feedback_id for feedback_id, _, _ in entries]
+        assignment = get_clustering_service().assign_to_clusters(
+            embeddings=[embedding for _, embedding, _ in entries],
+            centroids=[cluster.centroid for cluster in clusters],
+            radii=[cluster.radius or 0.0 for cluster in clusters]
+        )
+        
+        # Re-analyzed feedback moves out of its previous cluster with the score it was counted with
+        result = await session.execute(
+            delete(FeedbackClusterAssociation).where(
+                FeedbackClusterAssociation.feedback_id == Feedback.id,
+                FeedbackClusterAssociation.feedback_id.in_(feedback_ids)
+            ).returning(FeedbackClusterAssociation.cluster_id, Feedback.sentiment_score)
+        )
+        removed = defaultdict(list)
+        for cluster_id, previous_score in result:
+            removed[cluster_id].append(previous_score)
+        
+        await session.execute(
+            insert(FeedbackClusterAssociation),
+            [
+                {"feedback_id": feedback_id, "cluster_id": clusters[label].id, "similarity_score": similarity}
+                for feedback_id, label, similarity in zip(feedback_ids, assignment["labels"], assignment["similarities"])
+            ]
+        )
+        
+        for index, cluster in enumerate(clusters):
+            members = [i for i, label in enumerate(assignment["labels"]) if label == index]
+            previous_scores = [score for score in removed.get(cluster.id, []) if score is not None]
+            new_sentiments = [entries[i][2] for i in members if entries[i][2] is not None]
+            
+            # Running mean over the cluster's scored members, without the ones that left
+            scored_size = cluster.scored_size or 0
+            total = (cluster.avg_sentiment or 0.0) * scored_size - sum(previous_scores) + sum(new_sentiments)
+            scored_size = max(0, scored_size - len(previous_scores)) + len(new_sentiments)
+            cluster.scored_size = scored_size
+            cluster.avg_sentiment = total / scored_size if scored_size else None
+            
+            cluster.size = max(0, (cluster.size or 0) - len(removed.get(cluster.id, []))) + len(members)
+            if not members:
+                continue
+            
+            cluster.recent_size = (cluster.recent_size or 0) + len(members)
+            cluster.trend = cluster_trend(cluster.recent_size, cluster.previous_size)
+            cluster.assigned_since_fit = (cluster.assigned_since_fit or 0) + len(members)
+            cluster.outliers_since_fit = (cluster.outliers_since_fit or 0) + sum(
+                assignment["outliers"][i] for i in members
+            )
+        
+        await session.execute(
+            update(Feedback),
+            [
+                {"id": feedback_id, "topics": [f"cluster_{clusters[label].label}"]}
+                for feedback_id, label in zip(feedback_ids, assignment["labels"])
+            ]
+        )
+        
+        assigned = sum(cluster.assigned_since_fit or 0 for cluster in clusters)
+        outliers = sum(cluster.outliers_since_fit or 0 for cluster in clusters)
+        if assigned >= settings.CLUSTERING_DRIFT_MIN_ITEMS and outliers / assigned > settings.CLUSTERING_DRIFT_THRESHOLD:
+            logger.info(f"Cluster drift for tenant {tenant_id}: {outliers}/{assigned} new items are outliers")
+            drifted.append(tenant_id)
+    
+    return drifted
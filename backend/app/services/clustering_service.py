@@ -3,29 +3,178 @@ Topic Clustering Service using Embeddings
 """
 
 import numpy as np
-from sklearn.cluster import KMeans, DBSCAN
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Tuple
+from typing import Iterable, List, Dict, Optional, Tuple
 import logging
+import threading
 from collections import Counter
+from datetime import datetime
 
 from app.core.config import settings
+from app.services.cluster_selection import select_cluster_count
 
 logger = logging.getLogger(__name__)
 
 
+class _TenantVectors:
+    """Normalized embedding matrix and id mapping for one tenant"""
+    
+    def __init__(self, dim: int):
+        self.matrix = np.empty((0, dim), dtype=np.float32)  # Rows beyond size are spare capacity
+        self.size = 0
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.watermark: Optional[datetime] = None
+
+
+class VectorIndex:
+    """
+    In-process per-tenant vector index for cosine similarity search
+    
+    Each tenant has one float32 matrix of L2-normalized rows, so a cosine
+    search is a single matrix product plus argpartition. Used instead of
+    the pgvector index when the extension isn't available.
+    
+    Only the API process searches it. Newly analyzed feedback gets in on
+    the next search: the /similar endpoint first loads the rows analyzed
+    since the index's analyzed_at watermark.
+    """
+    
+    def __init__(self):
+        self._tenants: Dict[str, _TenantVectors] = {}
+        self._lock = threading.RLock()
+    
+    def is_loaded(self, tenant_id) -> bool:
+        return str(tenant_id) in self._tenants
+    
+    def watermark(self, tenant_id) -> Optional[datetime]:
+        """Latest analyzed_at loaded from the database for this tenant"""
+        tenant = self._tenants.get(str(tenant_id))
+        return tenant.watermark if tenant else None
+    
+    def size(self, tenant_id) -> int:
+        tenant = self._tenants.get(str(tenant_id))
+        return tenant.size if tenant else 0
+    
+    def upsert(
+        self,
+        tenant_id,
+        feedback_ids: List[str],
+        embeddings,
+        watermark: Optional[datetime] = None
+    ):
+        """Add or replace embeddings; creates the tenant's index if needed"""
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(feedback_ids), -1))
+        
+        with self._lock:
+            tenant = self._tenants.get(str(tenant_id))
+            if tenant is None:
+                tenant = _TenantVectors(vectors.shape[1])
+                self._tenants[str(tenant_id)] = tenant
+            
+            for feedback_id, vector in zip(map(str, feedback_ids), vectors):
+                position = tenant.positions.get(feedback_id)
+                if position is None:
+                    position = tenant.size
+                    if position == len(tenant.matrix):
+                        # Grow geometrically so appends stay amortized O(1)
+                        grown = np.empty((max(64, 2 * len(tenant.matrix)), tenant.matrix.shape[1]), dtype=np.float32)
+                        grown[:tenant.size] = tenant.matrix[:tenant.size]
+                        tenant.matrix = grown
+                    tenant.ids.append(feedback_id)
+                    tenant.positions[feedback_id] = position
+                    tenant.size += 1
+                tenant.matrix[position] = vector
+            
+            if watermark is not None:
+                tenant.watermark = max(watermark, tenant.watermark) if tenant.watermark else watermark
+    
+    def remove(self, tenant_id, feedback_ids: Iterable[str]):
+        """Drop embeddings, moving the last row into each freed slot"""
+        with self._lock:
+            tenant = self._tenants.get(str(tenant_id))
+            if tenant is None:
+                return
+            
+            for feedback_id in map(str, feedback_ids):
+                position = tenant.positions.pop(feedback_id, None)
+                if position is None:
+                    continue
+                
+                last = tenant.size - 1
+                if position != last:
+                    tenant.matrix[position] = tenant.matrix[last]
+                    tenant.ids[position] = tenant.ids[last]
+                    tenant.positions[tenant.ids[position]] = position
+                tenant.ids.pop()
+                tenant.size -= 1
+    
+    def invalidate(self, tenant_id):
+        """Forget a tenant's index; it is rebuilt on the next search"""
+        with self._lock:
+            self._tenants.pop(str(tenant_id), None)
+    
+    def search(
+        self,
+        tenant_id,
+        queries,
+        k: int,
+        exclude: Optional[Iterable[str]] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Find the k most similar feedback items for each query embedding
+        
+        Returns:
+            One list of (feedback_id, similarity) per query, best first
+        """
+        query_matrix = self._normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        
+        with self._lock:
+            tenant = self._tenants.get(str(tenant_id))
+            if tenant is None or tenant.size == 0:
+                return [[] for _ in query_matrix]
+            
+            similarities = query_matrix @ tenant.matrix[:tenant.size].T
+            ids = list(tenant.ids)
+            
+            for feedback_id in exclude or ():
+                position = tenant.positions.get(str(feedback_id))
+                if position is not None:
+                    similarities[:, position] = -np.inf
+        
+        top_k = min(k, similarities.shape[1])
+        if top_k <= 0:
+            return [[] for _ in query_matrix]
+        
+        results = []
+        for row in similarities:
+            candidates = np.argpartition(-row, top_k - 1)[:top_k]
+            candidates = candidates[np.argsort(-row[candidates])]
+            results.append([
+                (ids[idx], float(row[idx])) for idx in candidates if np.isfinite(row[idx])
+            ])
+        return results
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
 class ClusteringService:
     """Service for clustering feedback based on embeddings"""
     
     def __init__(self):
         self.min_cluster_size = settings.MIN_CLUSTER_SIZE
         self.max_clusters = settings.MAX_CLUSTERS
+        self.vector_index = VectorIndex()
     
     def cluster_feedback(
         self,
         embeddings: List[List[float]],
         texts: List[str],
-        n_clusters: int = None
+        n_clusters: int = None,
+        init_centroids: List[List[float]] = None
     ) -> Dict:
         """
         Cluster feedback items based on their embeddings
@@ -34,6 +183,8 @@ class ClusteringService:
             embeddings: List of embedding vectors
             texts: List of feedback texts (for keywords extraction)
             n_clusters: Number of clusters (auto-determined if None)
+            init_centroids: Centroids of a previous run to warm-start from;
+                used when n_clusters is None or matches their count
         
         Returns:
             Dictionary with cluster assignments and metadata
@@ -46,26 +197,48 @@ class ClusteringService:
                 "message": "Not enough feedback items for clustering"
             }
         
-        embeddings_array = np.array(embeddings)
+        embeddings_array = np.asarray(embeddings, dtype=np.float32)
+        
+        warm_start = (
+            init_centroids is not None
+            and len(init_centroids) >= 2
+            and len(init_centroids) <= len(embeddings)
+            and (n_clusters is None or n_clusters == len(init_centroids))
+        )
         
-        # Auto-determine number of clusters using elbow method
-        if n_clusters is None:
-            n_clusters = self._find_optimal_clusters(embeddings_array)
+        if warm_start:
+            # Refine the previous run's centroids instead of starting over
+            n_clusters = len(init_centroids)
+            init = np.asarray(init_centroids, dtype=np.float32)
+            n_init = 1
+        else:
+            # Auto-determine number of clusters using elbow method
+            if n_clusters is None:
+                n_clusters = self._find_optimal_clusters(embeddings_array)
+            
+            # Ensure n_clusters is within bounds
+            n_clusters = min(n_clusters, len(embeddings), self.max_clusters)
+            n_clusters = max(2, n_clusters)  # At least 2 clusters
+            init = "k-means++"
+            n_init = 3
         
-        # Ensure n_clusters is within bounds
-        n_clusters = min(n_clusters, len(embeddings), self.max_clusters)
-        n_clusters = max(2, n_clusters)  # At least 2 clusters
+        # Mini-batch K-means: each step only touches batch_size embeddings
+        from sklearn.cluster import MiniBatchKMeans
         
-        # Perform K-means clustering
-        kmeans = KMeans(
+        kmeans = MiniBatchKMeans(
             n_clusters=n_clusters,
-            random_state=42,
-            n_init=10
+            init=init,
+            n_init=n_init,
+            batch_size=settings.CLUSTERING_BATCH_SIZE,
+            random_state=42
         )
         labels = kmeans.fit_predict(embeddings_array)
+        centroids = kmeans.cluster_centers_
+        distances = np.linalg.norm(embeddings_array - centroids[labels], axis=1)
         
         # Create cluster metadata
         clusters = []
+        radii = []
         for cluster_id in range(n_clusters):
             cluster_indices = np.where(labels == cluster_id)[0]
             cluster_texts = [texts[i] for i in cluster_indices]
@@ -74,13 +247,14 @@ class ClusteringService:
             keywords = self._extract_cluster_keywords(cluster_texts)
             
             # Get representative samples (closest to centroid)
-            cluster_embeddings = embeddings_array[cluster_indices]
-            centroid = kmeans.cluster_centers_[cluster_id]
-            distances = np.linalg.norm(cluster_embeddings - centroid, axis=1)
-            closest_indices = np.argsort(distances)[:3]  # Top 3 closest
+            cluster_distances = distances[cluster_indices]
+            closest_indices = np.argsort(cluster_distances)[:3]  # Top 3 closest
             
             representative_texts = [cluster_texts[i] for i in closest_indices]
             
+            # Items assigned later beyond this distance count as drift
+            radii.append(float(np.percentile(cluster_distances, 95)) if len(cluster_indices) else 0.0)
+            
             clusters.append({
                 "id": int(cluster_id),
                 "size": int(len(cluster_indices)),
@@ -91,34 +265,57 @@ class ClusteringService:
         return {
             "n_clusters": int(n_clusters),
             "labels": [int(label) for label in labels],  # Convert all to Python int
-            "clusters": clusters
+            "clusters": clusters,
+            "centroids": centroids.tolist(),
+            "radii": radii,
+            "similarities": self._centroid_similarities(embeddings_array, centroids, labels).tolist(),
+            "warm_started": warm_start
         }
     
+    def assign_to_clusters(
+        self,
+        embeddings: List[List[float]],
+        centroids: List[List[float]],
+        radii: List[float]
+    ) -> Dict:
+        """
+        Assign new embeddings to the nearest existing cluster
+        
+        Returns:
+            Dictionary with labels, centroid similarities and an outlier flag
+            per item (farther from its centroid than the cluster radius)
+        """
+        embeddings_array = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        centroids_array = np.asarray(centroids, dtype=np.float32)
+        
+        distances = np.linalg.norm(embeddings_array[:, None, :] - centroids_array[None, :, :], axis=2)
+        labels = distances.argmin(axis=1)
+        nearest = distances[np.arange(len(labels)), labels]
+        
+        return {
+            "labels": [int(label) for label in labels],
+            "similarities": self._centroid_similarities(embeddings_array, centroids_array, labels).tolist(),
+            "outliers": [bool(flag) for flag in nearest > np.asarray(radii, dtype=np.float32)[labels]]
+        }
+    
+    @staticmethod
+    def _centroid_similarities(embeddings: np.ndarray, centroids: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        """Cosine similarity of each embedding to its assigned centroid"""
+        assigned = centroids[labels]
+        norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(assigned, axis=1)
+        norms[norms == 0] = 1.0
+        return np.einsum("ij,ij->i", embeddings, assigned) / norms
+    
     def _find_optimal_clusters(self, embeddings: np.ndarray, max_k: int = None) -> int:
         """
-        Use elbow method to find optimal number of clusters
+        Choose the number of clusters on a subsample within a time budget
         """
         if max_k is None:
             max_k = min(len(embeddings) // self.min_cluster_size, self.max_clusters)
         
         max_k = max(2, min(max_k, len(embeddings) - 1))
         
-        inertias = []
-        K_range = range(2, max_k + 1)
-        
-        for k in K_range:
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            kmeans.fit(embeddings)
-            inertias.append(kmeans.inertia_)
-        
-        # Find elbow using rate of change
-        if len(inertias) < 2:
-            return 2
-        
-        rates = np.diff(inertias)
-        elbow_index = np.argmax(rates) + 2  # +2 because we start from 2
-        
-        return min(elbow_index, max_k)
+        return select_cluster_count(embeddings, max_k=max_k, min_k=2)
     
     def _extract_cluster_keywords(self, texts: List[str], top_n: int = 5) -> List[str]:
         """
@@ -163,6 +360,8 @@ class ClusteringService:
         Returns:
             List of (index, similarity_score) tuples
         """
+        from sklearn.metrics.pairwise import cosine_similarity
+        
         query_vec = np.array(query_embedding).reshape(1, -1)
         embeddings_matrix = np.array(all_embeddings)
         
@@ -0,0 +1,93 @@
+"""
+Bulk Embedding Loader
+Streams embeddings from Postgres as binary straight into one float32 matrix
+"""
+
+from sqlalchemy import select, func, LargeBinary, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import namedtuple
+from typing import Any, List, Sequence, Tuple
+import logging
+
+import numpy as np
+
+from app.core.config import settings
+from app.models import Feedback
+
+logger = logging.getLogger(__name__)
+
+
+def _binary_embedding():
+    """
+    SQL expression of Feedback.embedding as bytes, with its numpy dtype and header size
+    
+    pgvector's *_send functions return the binary wire format: a 2-byte
+    dimension count and 2 unused bytes, then big-endian floats.
+    """
+    half = settings.EMBEDDING_STORAGE_DTYPE == "float16"
+    if settings.VECTOR_SEARCH_BACKEND == "pgvector":
+        send = func.halfvec_send if half else func.vector_send
+        return type_coerce(send(Feedback.embedding), LargeBinary), np.dtype(">f2" if half else ">f4"), 4
+    # Packed bytea; bypass the column type so rows stay raw bytes
+    return type_coerce(Feedback.embedding, LargeBinary), np.dtype("<f2" if half else "<f4"), 0
+
+
+async def load_embeddings(
+    session: AsyncSession,
+    tenant_id,
+    columns: Sequence[Any] = (),
+    where: Sequence[Any] = (),
+    chunk_size: int = None
+) -> Tuple[List, np.ndarray]:
+    """
+    Load a tenant's embeddings into a preallocated float32 matrix
+    
+    Rows are read through a server-side cursor `chunk_size` at a time and
+    each chunk is decoded with a single np.frombuffer, so no Python float
+    is created per dimension and peak memory is the matrix itself.
+    
+    Args:
+        columns: Extra Feedback columns to return alongside the id
+        where: Extra filter conditions
+    
+    Returns:
+        (id, *columns) named tuples and the matrix, row i belonging to rows[i]
+    """
+    chunk_size = chunk_size or settings.EMBEDDING_LOAD_CHUNK_SIZE
+    dim = settings.EMBEDDING_DIM
+    embedding, dtype, header = _binary_embedding()
+    
+    conditions = [Feedback.tenant_id == tenant_id, Feedback.embedding.isnot(None), *where]
+    expected = await session.scalar(select(func.count(Feedback.id)).where(*conditions))
+    
+    matrix = np.empty((expected, dim), dtype=np.float32)
+    # Plain tuples without the embedding bytes, so those are freed chunk by chunk
+    record = namedtuple("EmbeddingRow", ["id", *[column.key for column in columns]])
+    rows = []
+    row_bytes = header + dim * dtype.itemsize
+    
+    result = await session.stream(
+        select(Feedback.id, *columns, embedding.label("embedding_bytes")).where(*conditions).execution_options(
+            yield_per=chunk_size
+        )
+    )
+    async for partition in result.partitions():
+        buffer = b"".join(row.embedding_bytes for row in partition)
+        if len(buffer) != len(partition) * row_bytes:
+            raise ValueError(f"Stored embeddings don't match EMBEDDING_DIM={dim}")
+        
+        start = len(rows)
+        if start + len(partition) > len(matrix):
+            # Rows committed after the count; grow once for this chunk
+            matrix = np.concatenate([matrix, np.empty((start + len(partition) - len(matrix), dim), dtype=np.float32)])
+        
+        chunk = np.frombuffer(buffer, dtype=dtype).reshape(len(partition), -1)
+        matrix[start:start + len(partition)] = chunk[:, header // dtype.itemsize:]
+        rows.extend(record._make(row[:-1]) for row in partition)
+    
+    if len(rows) < len(matrix):
+        # Rows deleted after the count
+        matrix = matrix[:len(rows)]
+    
+    logger.debug(f"Loaded {len(rows)} embeddings for tenant {tenant_id}")
+    return rows, matrix
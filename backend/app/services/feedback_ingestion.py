@@ -0,0 +1,117 @@
+"""
+Streaming Feedback File Ingestion
+Parses uploaded feedback files in bounded chunks instead of loading them whole
+"""
+
+import csv
+import io
+import json
+import logging
+from itertools import islice
+from typing import Any, BinaryIO, Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['text']
+
+
+def iter_feedback_chunks(
+    file_obj: BinaryIO,
+    filename: str,
+    chunk_size: int
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield parsed feedback rows from an uploaded file, `chunk_size` at a time
+
+    CSV and JSON-lines are parsed incrementally, so memory stays bounded by
+    the chunk size. JSON arrays and Excel workbooks cannot be streamed and
+    are parsed whole before being chunked.
+
+    Raises:
+        ValueError: Unsupported format or missing required columns
+    """
+    rows = _iter_rows(file_obj, filename.lower())
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_rows(file_obj: BinaryIO, filename: str) -> Iterator[Dict[str, Any]]:
+    if filename.endswith('.csv'):
+        rows = _iter_csv(file_obj)
+    elif filename.endswith(('.jsonl', '.ndjson')):
+        rows = _iter_json_lines(file_obj)
+    elif filename.endswith('.json'):
+        rows = _iter_json(file_obj)
+    elif filename.endswith(('.xlsx', '.xls')):
+        rows = _iter_excel(file_obj)
+    else:
+        raise ValueError("Unsupported file format. Use CSV, JSON, JSON lines or Excel.")
+
+    first = True
+    for row in rows:
+        if first:
+            missing = [col for col in REQUIRED_COLUMNS if col not in row]
+            if missing:
+                raise ValueError(f"Missing required columns. Need: {REQUIRED_COLUMNS}")
+            first = False
+
+        # Rows without text can't be stored or analyzed
+        if not row.get('text'):
+            continue
+        yield row
+
+
+def _iter_csv(file_obj: BinaryIO) -> Iterator[Dict[str, Any]]:
+    stream = io.TextIOWrapper(file_obj, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.DictReader(stream):
+            # Empty cells become None, like missing values in the other formats
+            yield {key: (value if value != '' else None) for key, value in row.items()}
+    finally:
+        # Keep the underlying upload file open for the caller
+        stream.detach()
+
+
+def _iter_json_lines(file_obj: BinaryIO) -> Iterator[Dict[str, Any]]:
+    for line_number, line in enumerate(file_obj, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}")
+
+
+def _iter_json(file_obj: BinaryIO) -> Iterator[Dict[str, Any]]:
+    # Files named .json are often JSON lines; only arrays need a full parse
+    start = file_obj.read(1)
+    while start and start.isspace():
+        start = file_obj.read(1)
+    file_obj.seek(file_obj.tell() - len(start))
+
+    if start != b'[':
+        yield from _iter_json_lines(file_obj)
+        return
+
+    try:
+        records = json.load(file_obj)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+
+    for record in records:
+        yield record
+
+
+def _iter_excel(file_obj: BinaryIO) -> Iterator[Dict[str, Any]]:
+    import pandas as pd
+
+    df = pd.read_excel(file_obj)
+    df = df.astype(object).where(df.notna(), None)
+
+    for record in df.to_dict(orient='records'):
+        yield record
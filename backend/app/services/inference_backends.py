@@ -0,0 +1,498 @@
+"""
+Inference Backends for the Analyzer Models
+Runs the sentiment, emotion and embedding models with eager PyTorch, ONNX Runtime or TorchScript
+
+Non-eager backends load artifacts written by the export step, which only
+saves a model after its outputs match eager mode:
+
+    python -m app.services.inference_backends export --backend onnx
+
+The eager backend can instead run with INT8 dynamically quantized linear
+layers (INFERENCE_QUANTIZE), once a labelled sample shows the int8 models
+agree with fp32:
+
+    python -m app.services.inference_backends quantize --sample labelled.csv
+"""
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import csv
+import io
+import json
+import logging
+import re
+import sys
+import time
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "torchscript")
+
+# Texts for the equivalence check; varied lengths and tones
+CHECK_TEXTS = [
+    "Thanks!",
+    "The app crashes every time I try to log in, please fix this ASAP.",
+    "I love the new dashboard, it makes weekly reporting so much easier.",
+    "It would be great if you could add dark mode and CSV export to the reports page.",
+    "Honestly it's fine. Nothing special, does what it says.",
+    "Support took three days to answer and the answer didn't solve anything. Switching to a competitor.",
+    "Why is checkout so slow today?",
+    "Great product overall but the billing page is confusing and I was charged twice last month. "
+    "I contacted support and they were helpful, but it took a while to get the refund processed.",
+]
+
+
+class SequenceClassifier(ABC):
+    """Text classifier returning class probabilities"""
+    labels: List[str]
+    variant: str  # Backend and precision actually loaded, e.g. "torch-int8"
+    
+    @abstractmethod
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        """Class probabilities, one row per text with columns in `labels` order"""
+
+
+class TextEmbedder(ABC):
+    """Sentence embedding model returning one float32 row per text"""
+    variant: str  # Backend and precision actually loaded, e.g. "torch-int8"
+    
+    @abstractmethod
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Float32 embeddings, one row per text"""
+
+
+class TorchClassifier(SequenceClassifier):
+    """Eager PyTorch classifier, the reference the other backends are checked against"""
+    
+    def __init__(self, model_name: str, device: str = "cpu", quantize: bool = False):
+        self.device = device
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device).eval()
+        self.labels = _labels(self.model.config)
+        self.variant = "torch-int8" if quantize else "torch"
+        if quantize:
+            self.model = quantize_dynamic(self.model)
+    
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        
+        with torch.no_grad():
+            logits = self.model(**inputs).logits
+        
+        return torch.nn.functional.softmax(logits, dim=-1).cpu().numpy()
+
+
+class TorchEmbedder(TextEmbedder):
+    """Eager SentenceTransformer"""
+    
+    def __init__(self, model_name: str, device: str = "cpu", quantize: bool = False):
+        from sentence_transformers import SentenceTransformer
+        
+        self.model = SentenceTransformer(model_name, device=device)
+        self.variant = "torch-int8" if quantize else "torch"
+        if quantize:
+            self.model = quantize_dynamic(self.model)
+    
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True).astype(np.float32)
+
+
+class _ExportedModel(SequenceClassifier, TextEmbedder):
+    """Shared tokenization and pooling for models loaded from an export directory"""
+    
+    def __init__(self, model_dir: Path):
+        self.manifest = json.loads((model_dir / "manifest.json").read_text())
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.labels = self.manifest.get("labels")
+    
+    def _tokenize(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        inputs = self.tokenizer(
+            texts,
+            return_tensors="np",
+            padding=True,
+            truncation=True,
+            max_length=self.manifest["max_length"]
+        )
+        return {name: inputs[name].astype(np.int64) for name in self.manifest["input_names"]}
+    
+    @abstractmethod
+    def _outputs(self, texts: List[str], inputs: Dict[str, np.ndarray] = None) -> np.ndarray:
+        """Raw model output: logits or token embeddings"""
+    
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        return _softmax(self._outputs(texts))
+    
+    def encode(self, texts: List[str]) -> np.ndarray:
+        inputs = self._tokenize(texts)
+        return _pool(self._outputs(texts, inputs), inputs["attention_mask"], self.manifest)
+
+
+class OnnxModel(_ExportedModel):
+    """Model exported to ONNX, run by ONNX Runtime with full graph optimization"""
+    variant = "onnx"
+    
+    def __init__(self, model_dir: Path):
+        import onnxruntime as ort
+        
+        super().__init__(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if settings.INFERENCE_NUM_THREADS:
+            options.intra_op_num_threads = settings.INFERENCE_NUM_THREADS
+        self.session = ort.InferenceSession(
+            str(model_dir / "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+    
+    def _outputs(self, texts: List[str], inputs: Dict[str, np.ndarray] = None) -> np.ndarray:
+        inputs = inputs if inputs is not None else self._tokenize(texts)
+        return self.session.run(None, inputs)[0]
+
+
+class TorchScriptModel(_ExportedModel):
+    """Model traced and frozen with TorchScript"""
+    variant = "torchscript"
+    
+    def __init__(self, model_dir: Path):
+        super().__init__(model_dir)
+        if settings.INFERENCE_NUM_THREADS:
+            torch.set_num_threads(settings.INFERENCE_NUM_THREADS)
+        self.module = torch.jit.load(str(model_dir / "model.pt"))
+    
+    def _outputs(self, texts: List[str], inputs: Dict[str, np.ndarray] = None) -> np.ndarray:
+        inputs = inputs if inputs is not None else self._tokenize(texts)
+        with torch.no_grad():
+            return self.module(*[torch.from_numpy(inputs[name]) for name in self.manifest["input_names"]]).numpy()
+
+
+def quantize_dynamic(model: torch.nn.Module) -> torch.nn.Module:
+    """Model with its Linear layers replaced by dynamically quantized INT8 ones (CPU only)"""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_classifier(model_name: str, device: str = "cpu") -> SequenceClassifier:
+    """Classifier on the configured backend, eager PyTorch if there is no verified export"""
+    model_dir = _verified_export(model_name)
+    if model_dir is None:
+        return TorchClassifier(model_name, device, quantize=_use_quantized(model_name, device))
+    return _EXPORTED[settings.INFERENCE_BACKEND](model_dir)
+
+
+def load_embedder(model_name: str, device: str = "cpu") -> TextEmbedder:
+    """Embedder on the configured backend, eager PyTorch if there is no verified export"""
+    model_dir = _verified_export(model_name)
+    if model_dir is None:
+        return TorchEmbedder(model_name, device, quantize=_use_quantized(model_name, device))
+    return _EXPORTED[settings.INFERENCE_BACKEND](model_dir)
+
+
+def _use_quantized(model_name: str, device: str) -> bool:
+    """Whether to quantize the eager model: requested, on CPU and validated on a labelled sample"""
+    if not settings.INFERENCE_QUANTIZE:
+        return False
+    if device != "cpu":
+        logger.warning(f"INT8 dynamic quantization is CPU only, running {model_name} in fp32 on {device}")
+        return False
+    
+    marker = quantization_marker(model_name)
+    if not marker.exists() or not json.loads(marker.read_text()).get("passed"):
+        logger.warning(f"INT8 {model_name} hasn't passed validation ({marker}), running in fp32")
+        return False
+    
+    logger.info(f"Loading {model_name} with INT8 dynamic quantization")
+    return True
+
+
+def quantization_marker(model_name: str) -> Path:
+    """Validation result that gates the quantized mode for one model"""
+    return export_dir("int8", model_name) / "validation.json"
+
+
+def _verified_export(model_name: str) -> Optional[Path]:
+    backend = settings.INFERENCE_BACKEND
+    if backend == "torch":
+        return None
+    
+    model_dir = export_dir(backend, model_name)
+    manifest = model_dir / "manifest.json"
+    if not manifest.exists() or not json.loads(manifest.read_text()).get("verified"):
+        logger.warning(f"No verified {backend} export of {model_name} in {model_dir}, using eager PyTorch")
+        return None
+    
+    logger.info(f"Loading {model_name} with the {backend} backend")
+    return model_dir
+
+
+def export_dir(backend: str, model_name: str) -> Path:
+    return Path(settings.INFERENCE_MODEL_DIR) / backend / re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name)
+
+
+_EXPORTED = {"onnx": OnnxModel, "torchscript": TorchScriptModel}
+
+
+def _labels(config) -> List[str]:
+    return [config.id2label[i] for i in range(config.num_labels)]
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def _pool(token_embeddings: np.ndarray, attention_mask: np.ndarray, manifest: Dict) -> np.ndarray:
+    """Sentence embeddings from token embeddings, as the SentenceTransformer pooling layer does"""
+    mask = attention_mask[..., None].astype(np.float32)
+    if manifest["pooling"] == "cls":
+        pooled = token_embeddings[:, 0]
+    elif manifest["pooling"] == "max":
+        pooled = np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+    else:
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    
+    if manifest["normalize"]:
+        pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    return pooled.astype(np.float32)
+
+
+class _ExportWrapper(torch.nn.Module):
+    """Positional-input module returning only the first output (logits or token embeddings)"""
+    
+    def __init__(self, model, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+    
+    def forward(self, *inputs):
+        # Works for ModelOutput and for the tuples of torchscript=True models
+        return self.model(**dict(zip(self.input_names, inputs)))[0]
+
+
+def export_model(backend: str, model_name: str, kind: str, tolerance: float = None) -> Path:
+    """
+    Export one model for `backend` and check it against eager mode
+    
+    Classifiers must agree on every label with probabilities within
+    `tolerance`; embeddings need a cosine similarity of at least 1 - tolerance.
+    
+    Raises:
+        ValueError: The exported model's outputs differ from eager mode
+    """
+    tolerance = tolerance if tolerance is not None else settings.INFERENCE_EXPORT_TOLERANCE
+    model_dir = export_dir(backend, model_name)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(str(model_dir))
+    
+    if kind == "classifier":
+        reference = TorchClassifier(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name, torchscript=backend == "torchscript")
+        labels, max_length = reference.labels, 512
+        manifest = {}
+    else:
+        reference = TorchEmbedder(model_name)
+        transformer, pooling = reference.model[0], reference.model[1].get_config_dict()
+        model = AutoModel.from_pretrained(model_name, torchscript=backend == "torchscript")
+        labels, max_length = None, transformer.max_seq_length
+        manifest = {
+            "pooling": "cls" if pooling.get("pooling_mode_cls_token") else
+                       "max" if pooling.get("pooling_mode_max_tokens") else "mean",
+            "normalize": any(type(module).__name__ == "Normalize" for module in reference.model),
+        }
+    
+    model.eval()
+    sample = tokenizer(CHECK_TEXTS[:2], return_tensors="pt", padding=True, truncation=True, max_length=max_length)
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    wrapper = _ExportWrapper(model, input_names)
+    example = tuple(sample[name] for name in input_names)
+    
+    if backend == "onnx":
+        axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        axes["output"] = {0: "batch"} if kind == "classifier" else {0: "batch", 1: "sequence"}
+        torch.onnx.export(
+            wrapper, example, str(model_dir / "model.onnx"),
+            input_names=input_names,
+            output_names=["output"],
+            dynamic_axes=axes,
+            opset_version=14
+        )
+    else:
+        with torch.no_grad():
+            traced = torch.jit.trace(wrapper, example, strict=False)
+            traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+        traced.save(str(model_dir / "model.pt"))
+    
+    manifest.update({
+        "model": model_name,
+        "kind": kind,
+        "backend": backend,
+        "input_names": input_names,
+        "max_length": max_length,
+        "labels": labels,
+        "verified": False,
+    })
+    (model_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    
+    candidate = _EXPORTED[backend](model_dir)
+    report = check_equivalence(reference, candidate, kind, tolerance)
+    logger.info(f"{backend} export of {model_name}: {report}")
+    if not report["equivalent"]:
+        raise ValueError(f"{backend} export of {model_name} differs from eager mode: {report}")
+    
+    manifest["verified"] = True
+    manifest["check"] = report
+    (model_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    return model_dir
+
+
+def check_equivalence(reference, candidate, kind: str, tolerance: float, texts: List[str] = None) -> Dict:
+    """Compare a candidate model's outputs to the reference on sample texts"""
+    texts = texts or CHECK_TEXTS
+    if kind == "classifier":
+        expected, actual = reference.predict_proba(texts), candidate.predict_proba(texts)
+        max_diff = float(np.abs(expected - actual).max())
+        agreement = float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+        return {
+            "max_abs_diff": max_diff,
+            "label_agreement": agreement,
+            "equivalent": agreement == 1.0 and max_diff <= tolerance,
+        }
+    
+    expected, actual = reference.encode(texts), candidate.encode(texts)
+    cosine = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    return {
+        "min_cosine": float(cosine.min()),
+        "equivalent": float(cosine.min()) >= 1.0 - tolerance,
+    }
+
+
+def load_labelled_sample(path: str) -> Dict[str, List]:
+    """
+    Texts and optional gold labels from a CSV with a `text` column
+    
+    `sentiment` (negative/neutral/positive) and `emotion` columns are
+    optional; blank cells are skipped when scoring accuracy.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.DictReader(f) if (row.get("text") or "").strip()]
+    
+    return {
+        "texts": [row["text"] for row in rows],
+        "sentiment": [(row.get("sentiment") or "").strip().lower() or None for row in rows],
+        "emotion": [(row.get("emotion") or "").strip().lower() or None for row in rows],
+    }
+
+
+def validate_quantization(sample: Dict[str, List], batch_size: int = 32) -> Dict:
+    """
+    Run the fp32 and INT8 models over a labelled sample and write the verdict
+    
+    Classifiers pass when fp32 and int8 agree on at least
+    INFERENCE_QUANTIZE_MIN_AGREEMENT of the labels; the embedder when no
+    text's embeddings drift below INFERENCE_QUANTIZE_MIN_COSINE. Each
+    model's verdict is stored in its quantization marker, which load_*
+    check before quantizing.
+    """
+    texts = sample["texts"]
+    report = {}
+    for name, model_name, kind in (
+        ("sentiment", settings.SENTIMENT_MODEL, "classifier"),
+        ("emotion", settings.EMOTION_MODEL, "classifier"),
+        ("embedding", settings.EMBEDDING_MODEL, "embedder"),
+    ):
+        model_class = TorchClassifier if kind == "classifier" else TorchEmbedder
+        fp32 = model_class(model_name)
+        int8 = model_class(model_name, quantize=True)
+        method = "predict_proba" if kind == "classifier" else "encode"
+        
+        expected, fp32_seconds = _timed_batches(getattr(fp32, method), texts, batch_size)
+        actual, int8_seconds = _timed_batches(getattr(int8, method), texts, batch_size)
+        result = {
+            "model": model_name,
+            "samples": len(texts),
+            "fp32_mb": _state_dict_mb(fp32.model),
+            "int8_mb": _state_dict_mb(int8.model),
+            "fp32_seconds": fp32_seconds,
+            "int8_seconds": int8_seconds,
+        }
+        
+        if kind == "classifier":
+            expected_labels = [fp32.labels[i].lower() for i in expected.argmax(axis=1)]
+            actual_labels = [int8.labels[i].lower() for i in actual.argmax(axis=1)]
+            agreement = float(np.mean([a == b for a, b in zip(expected_labels, actual_labels)]))
+            result["label_agreement"] = agreement
+            result["max_abs_diff"] = float(np.abs(expected - actual).max())
+            
+            gold = sample.get(name) or []
+            scored = [i for i, label in enumerate(gold) if label]
+            if scored:
+                result["fp32_accuracy"] = float(np.mean([expected_labels[i] == gold[i] for i in scored]))
+                result["int8_accuracy"] = float(np.mean([actual_labels[i] == gold[i] for i in scored]))
+            result["passed"] = agreement >= settings.INFERENCE_QUANTIZE_MIN_AGREEMENT
+        else:
+            cosine = (expected * actual).sum(axis=1) / np.clip(
+                np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1), 1e-12, None
+            )
+            result["mean_cosine"] = float(cosine.mean())
+            result["min_cosine"] = float(cosine.min())
+            result["passed"] = result["min_cosine"] >= settings.INFERENCE_QUANTIZE_MIN_COSINE
+        
+        marker = quantization_marker(model_name)
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.write_text(json.dumps(result, indent=2))
+        logger.info(f"INT8 {name} ({model_name}): {result}")
+        report[name] = result
+    
+    return report
+
+
+def _timed_batches(fn, texts: List[str], batch_size: int):
+    start = time.perf_counter()
+    outputs = np.concatenate([fn(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+    return outputs, time.perf_counter() - start
+
+
+def _state_dict_mb(model: torch.nn.Module) -> float:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return round(buffer.tell() / 1024 / 1024, 1)
+
+
+def export_all(backend: str):
+    """Export and verify the sentiment, emotion and embedding models"""
+    for model_name, kind in (
+        (settings.SENTIMENT_MODEL, "classifier"),
+        (settings.EMOTION_MODEL, "classifier"),
+        (settings.EMBEDDING_MODEL, "embedder"),
+    ):
+        export_model(backend, model_name, kind)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or quantize analyzer models for faster inference")
+    parser.add_argument("command", choices=["export", "quantize"])
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="onnx")
+    parser.add_argument("--sample", help="Labelled CSV for `quantize` (text, sentiment, emotion columns)")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "export":
+        export_all(args.backend)
+    else:
+        if not args.sample:
+            parser.error("quantize needs --sample")
+        report = validate_quantization(load_labelled_sample(args.sample))
+        print(json.dumps(report, indent=2))
+        if not all(result["passed"] for result in report.values()):
+            print("INT8 mode stays off for models below the agreement threshold", file=sys.stderr)
+            sys.exit(1)
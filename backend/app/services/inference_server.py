@@ -0,0 +1,278 @@
+"""
+Local Inference Server
+One process owns the models and batches the model calls of every API and worker process
+
+    python -m app.services.inference_server
+
+Callers connect over a unix socket (INFERENCE_SERVER_SOCKET). Each text is
+queued on the model's LengthBucketedBatcher, so texts from all connections
+are padded and run together by token length. get_ai_analyzer() returns a
+RemoteAIAnalyzer, backed by InferenceClient, whenever the socket is set.
+
+Messages are JSON framed by a 4-byte big-endian length:
+    request:  {"id": 1, "op": "analyze" | "sentiment" | "emotion" | "embedding" | "ping", "texts": [...]}
+    response: {"id": 1, "results": [...], "variants": [...]} or {"id": 1, "error": "..."}
+"variants" are the backend and precision the three models loaded with, the
+callers' analysis cache key. "analyze" returns [sentiment, emotion, embedding] per text. Embeddings
+travel as base64 float32, "" when the model failed.
+"""
+
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+OPERATIONS = ("analyze", "sentiment", "emotion", "embedding")
+
+
+class InferenceServerError(RuntimeError):
+    """The inference server is unreachable, timed out or couldn't run a request"""
+
+
+def _encode_frame(message: Dict) -> bytes:
+    payload = json.dumps(message).encode()
+    return HEADER.pack(len(payload)) + payload
+
+
+def _encode_embedding(embedding: List[float]) -> str:
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode() if len(embedding) else ""
+
+
+def _decode_embedding(value: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(value), dtype=np.float32).tolist()
+
+
+def _encode_results(op: str, results: List) -> List:
+    if op == "embedding":
+        return [_encode_embedding(embedding) for embedding in results]
+    if op == "analyze":
+        return [[sentiment, emotion, _encode_embedding(embedding)] for sentiment, emotion, embedding in results]
+    return results
+
+
+def _decode_results(op: str, results: List) -> List:
+    if op == "embedding":
+        return [_decode_embedding(value) for value in results]
+    if op == "analyze":
+        return [[sentiment, emotion, _decode_embedding(value)] for sentiment, emotion, value in results]
+    return results
+
+
+class InferenceServer:
+    """
+    Serves the analyzer's three models to every process on the host
+    
+    Runs its own AIAnalyzer with dynamic batching on; requests on one
+    connection are handled concurrently and answered by id.
+    """
+    
+    def __init__(self, socket_path: str):
+        from app.services.ai_analyzer import AIAnalyzer
+        
+        self.socket_path = socket_path
+        self.analyzer = AIAnalyzer(dynamic_batching=True)
+        self.variants = self.analyzer.model_variants()
+        self.connections = 0
+    
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # Left over from an unclean shutdown
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        
+        server = await asyncio.start_unix_server(self._serve_connection, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"✅ Inference server listening on {self.socket_path}")
+        
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        
+        async with server:
+            await stop.wait()
+        
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        logger.info("Inference server stopped")
+    
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        write_lock = asyncio.Lock()
+        tasks = set()
+        
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                (length,) = HEADER.unpack(header)
+                if length > MAX_FRAME_BYTES:
+                    logger.warning(f"Dropping connection sending a {length} byte frame")
+                    break
+                
+                request = json.loads(await reader.readexactly(length))
+                task = asyncio.create_task(self._answer(request, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except asyncio.IncompleteReadError:
+            pass  # Client closed the connection
+        except Exception as e:
+            logger.error(f"Inference connection error: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.connections -= 1
+            writer.close()
+    
+    async def _answer(self, request: Dict, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        op = request.get("op")
+        try:
+            if op == "ping":
+                response = {"id": request.get("id"), "results": [], "pid": os.getpid(), "connections": self.connections}
+            elif op == "analyze":
+                results = [
+                    await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+                    for futures in [self.analyzer.submit_model_outputs(text) for text in request.get("texts", [])]
+                ]
+                response = {"id": request.get("id"), "results": _encode_results(op, results)}
+            elif op in OPERATIONS:
+                batcher = self.analyzer.batchers[op]
+                results = await asyncio.gather(*[
+                    asyncio.wrap_future(batcher.submit(text)) for text in request.get("texts", [])
+                ])
+                response = {"id": request.get("id"), "results": _encode_results(op, results)}
+            else:
+                response = {"id": request.get("id"), "error": f"Unknown operation: {op}"}
+            response.setdefault("variants", self.variants)
+        except Exception as e:
+            logger.error(f"Inference {op} request failed: {e}")
+            response = {"id": request.get("id"), "error": str(e)}
+        
+        async with write_lock:
+            writer.write(_encode_frame(response))
+            await writer.drain()
+
+
+class InferenceClient:
+    """
+    Blocking client for the inference server
+    
+    Each thread keeps its own connection, reopened once if the server went
+    away in between. Connections are dropped in forked children.
+    """
+    
+    def __init__(self, socket_path: str, timeout: float = None):
+        self.socket_path = socket_path
+        self.timeout = timeout or settings.INFERENCE_SERVER_TIMEOUT
+        self.variants: Optional[List[str]] = None  # Of the server that sent the last response
+        self._reset()
+        
+        os.register_at_fork(after_in_child=self._reset)
+    
+    def _reset(self):
+        self._local = threading.local()
+        self._ids = itertools.count()
+    
+    def call(self, op: str, texts: List[str]) -> List:
+        """
+        Model outputs for texts, one per text in order
+        
+        Raises:
+            InferenceServerError: The server is unreachable, timed out or failed the request
+        """
+        request = {"id": next(self._ids), "op": op, "texts": texts}
+        for attempt in range(2):
+            try:
+                response = self._request(request)
+                break
+            except socket.timeout as e:
+                self._close()
+                raise InferenceServerError(f"Inference server timed out after {self.timeout}s") from e
+            except OSError as e:
+                # A connection from before a server restart fails on first use
+                self._close()
+                if attempt:
+                    raise InferenceServerError(f"Inference server unreachable: {e}") from e
+        
+        if "error" in response:
+            raise InferenceServerError(f"Inference server: {response['error']}")
+        self.variants = response.get("variants")
+        return _decode_results(op, response["results"])
+    
+    def ping(self) -> Dict:
+        request = {"id": next(self._ids), "op": "ping", "texts": []}
+        return self._request(request)
+    
+    def _request(self, request: Dict) -> Dict:
+        connection = self._connection()
+        connection.sendall(_encode_frame(request))
+        (length,) = HEADER.unpack(self._read_exactly(connection, HEADER.size))
+        return json.loads(self._read_exactly(connection, length))
+    
+    def _connection(self) -> socket.socket:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(self.socket_path)
+            except OSError:
+                connection.close()
+                raise
+            self._local.connection = connection
+        return connection
+    
+    def _close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+    
+    @staticmethod
+    def _read_exactly(connection: socket.socket, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = connection.recv(min(size, 1024 * 1024))
+            if not chunk:
+                raise ConnectionResetError("Inference server closed the connection")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the analyzer models over a unix socket")
+    parser.add_argument("--socket", default=settings.INFERENCE_SERVER_SOCKET, help="Unix socket path")
+    parser.add_argument("--ping", action="store_true", help="Check a running server and exit")
+    args = parser.parse_args()
+    
+    if not args.socket:
+        parser.error("set INFERENCE_SERVER_SOCKET or pass --socket")
+    
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if args.ping:
+        try:
+            print(json.dumps(InferenceClient(args.socket, timeout=5).ping()))
+        except OSError as e:
+            print(f"❌ Inference server unreachable: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        asyncio.run(InferenceServer(args.socket).serve())
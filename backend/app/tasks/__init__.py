@@ -2,6 +2,12 @@
 Celery tasks package
 """
 
-from app.tasks.analysis_tasks import celery_app, analyze_feedback_task
+from app.tasks.analysis_tasks import (
+    celery_app,
+    analyze_feedback_task,
+    analyze_feedback_batch_task,
+    run_clustering_task
+)
+from app.tasks import worker_bootstrap  # noqa: F401  Registers the worker signal handlers
 
-__all__ = ['celery_app', 'analyze_feedback_task']
+__all__ = ['celery_app', 'analyze_feedback_task', 'analyze_feedback_batch_task', 'run_clustering_task']
@@ -4,13 +4,26 @@ Celery Tasks for Background Processing
 
 from celery import Celery
 from datetime import datetime
+from typing import Dict, List, Tuple
+import asyncio
+import json
 import logging
 
+from app.core.cache import get_sync_redis
 from app.core.config import settings
 from app.core.database import AsyncSessionLocal
-from app.models import Feedback
+from app.models import Feedback, FeedbackCluster
 from app.services.ai_analyzer import get_ai_analyzer
-from sqlalchemy import select
+from app.services.analytics_rollup import RollupDelta, analyzed_values
+from app.services.cluster_store import (
+    assign_new_feedback,
+    clustering_cache_key,
+    lock_clusters,
+    recluster_tenant,
+    refit_lock_key
+)
+from app.services.inference_server import InferenceServerError
+from sqlalchemy import select, update, distinct
 
 logger = logging.getLogger(__name__)
 
@@ -27,70 +40,319 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    beat_schedule={
+        "recluster-all-tenants": {
+            "task": "recluster_all_tenants",
+            "schedule": settings.CLUSTERING_SCHEDULE_HOURS * 3600,
+        },
+    },
 )
 
 
-@celery_app.task(name="analyze_feedback")
-def analyze_feedback_task(feedback_id: str):
+def _run_async(coro):
+    """Run a coroutine to completion on this worker's event loop"""
+    # Get or create event loop for async operations
+    try:
+        loop = asyncio.get_event_loop()
+        if loop.is_closed():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    
+    return loop.run_until_complete(coro)
+
+
+def _retry_countdown(retries: int) -> int:
+    """Seconds before retrying analysis the inference server couldn't run"""
+    return min(600, 15 * 2 ** retries)
+
+
+def _analysis_values(analysis: Dict) -> Dict:
+    """Map analyzer output to Feedback column values"""
+    return {
+        "sentiment": analysis.get("sentiment"),
+        "sentiment_score": analysis.get("sentiment_score"),
+        "emotion": analysis.get("emotion"),
+        "emotion_scores": analysis.get("emotion_scores"),
+        "urgency_score": analysis.get("urgency_score"),
+        "urgency_level": analysis.get("urgency_level"),
+        "keywords": analysis.get("keywords"),
+        "embedding": analysis.get("embedding") or None,  # [] when the model failed
+        "is_feature_request": analysis.get("is_feature_request"),
+        "is_bug_report": analysis.get("is_bug_report"),
+        "competitor_names": analysis.get("competitor_mentions"),
+        "priority_score": analysis.get("priority_score"),
+        "analyzed_at": datetime.utcnow(),
+    }
+
+
+async def _assign_to_clusters(session, items: List[Tuple]) -> List:
+    """
+    Assign new (tenant_id, feedback_id, embedding, sentiment_score) items to existing clusters
+    
+    Runs in a savepoint of the analysis transaction, before the new scores
+    are written; if it fails the analysis still commits. Returns the
+    tenants to re-fit.
+    """
+    try:
+        async with session.begin_nested():
+            return await assign_new_feedback(session, items)
+    except Exception as e:
+        logger.error(f"Error assigning feedback to clusters: {str(e)}")
+        return []
+
+
+def _queue_refits(tenant_ids: List):
+    """Queue a full re-fit of tenants whose topics drifted from the fitted centroids"""
+    # Drift counters only reset when the re-fit commits, so later chunks see
+    # drift too: queue one re-fit per tenant until it has run
+    for tenant_id in tenant_ids:
+        if get_sync_redis().set(refit_lock_key(tenant_id), 1, nx=True, ex=settings.CLUSTERING_REFIT_LOCK_SECONDS):
+            recluster_tenant_task.delay(str(tenant_id), warm_start=False)
+
+
+@celery_app.task(name="analyze_feedback", bind=True, max_retries=5)
+def analyze_feedback_task(self, feedback_id: str):
     """
     Background task to analyze feedback using AI/ML models
     """
-    import asyncio
-    
     async def _analyze():
         async with AsyncSessionLocal() as session:
             try:
-                # Get feedback
+                # Get feedback text; the models run outside any transaction
                 result = await session.execute(
-                    select(Feedback).where(Feedback.id == feedback_id)
+                    select(Feedback.tenant_id, Feedback.text).where(Feedback.id == feedback_id)
                 )
-                feedback = result.scalar_one_or_none()
+                row = result.one_or_none()
+                await session.rollback()
                 
-                if not feedback:
+                if row is None:
                     logger.error(f"Feedback {feedback_id} not found")
                     return
                 
-                # Get AI analyzer
-                analyzer = get_ai_analyzer()
-                
                 # Analyze feedback
-                analysis = analyzer.analyze_feedback(feedback.text)
+                analysis = get_ai_analyzer().analyze_feedback(row.text)
+                values = _analysis_values(analysis)
+                
+                # Locked so a concurrent re-analysis can't double count the rollup
+                # or cluster counters; clusters first, held only for the update
+                await lock_clusters(session, [row.tenant_id])
+                result = await session.execute(
+                    select(Feedback).where(Feedback.id == feedback_id).with_for_update()
+                )
+                feedback = result.scalar_one_or_none()
+                
+                if not feedback:
+                    logger.warning(f"Feedback {feedback_id} was deleted during analysis")
+                    return
+                
+                drifted = await _assign_to_clusters(session, [
+                    (feedback.tenant_id, feedback.id, values["embedding"], values["sentiment_score"])
+                ])
                 
                 # Update feedback with analysis results
-                feedback.sentiment = analysis.get("sentiment")
-                feedback.sentiment_score = analysis.get("sentiment_score")
-                feedback.emotion = analysis.get("emotion")
-                feedback.emotion_scores = analysis.get("emotion_scores")
-                feedback.urgency_score = analysis.get("urgency_score")
-                feedback.urgency_level = analysis.get("urgency_level")
-                feedback.keywords = analysis.get("keywords")
-                feedback.embedding = analysis.get("embedding")
-                feedback.is_feature_request = analysis.get("is_feature_request")
-                feedback.is_bug_report = analysis.get("is_bug_report")
-                feedback.competitor_names = analysis.get("competitor_mentions")
-                feedback.priority_score = analysis.get("priority_score")
-                feedback.analyzed_at = datetime.utcnow()
+                rollup = RollupDelta()
+                rollup.replace(feedback, analyzed_values(feedback), values)
+                for field, value in values.items():
+                    setattr(feedback, field, value)
                 
+                await rollup.apply(session)
                 await session.commit()
                 
-                logger.info(f"Successfully analyzed feedback {feedback_id}")
+                _queue_refits(drifted)
                 
+                logger.info(f"Successfully analyzed feedback {feedback_id}")
+            
+            except InferenceServerError as e:
+                await session.rollback()
+                raise self.retry(exc=e, countdown=_retry_countdown(self.request.retries))
             except Exception as e:
                 logger.error(f"Error analyzing feedback {feedback_id}: {str(e)}")
                 await session.rollback()
     
-    # Get or create event loop for async operations
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_closed():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    _run_async(_analyze())
+
+
+@celery_app.task(name="analyze_feedback_batch", bind=True, max_retries=5)
+def analyze_feedback_batch_task(self, feedback_ids: List[str]):
+    """
+    Background task to analyze many feedback items with batched inference
+    
+    Each chunk of ANALYSIS_TASK_CHUNK_SIZE texts is loaded with one IN query
+    and run through the models in micro-batches with no transaction open.
+    The rows are then locked only for one bulk UPDATE and the daily rollup
+    adjustment, so a failing chunk does not roll back the others. If the
+    inference server is down, the task is retried from the first
+    unfinished chunk.
+    """
+    async def _analyze_batch():
+        analyzer = get_ai_analyzer()
+        chunk_size = settings.ANALYSIS_TASK_CHUNK_SIZE
+        
+        for start in range(0, len(feedback_ids), chunk_size):
+            chunk_ids = feedback_ids[start:start + chunk_size]
+            
+            async with AsyncSessionLocal() as session:
+                try:
+                    result = await session.execute(
+                        select(Feedback.id, Feedback.tenant_id, Feedback.text).where(Feedback.id.in_(chunk_ids))
+                    )
+                    found = result.all()
+                    texts = {row.id: row.text for row in found}
+                    await session.rollback()  # No transaction open during inference
+                    
+                    if len(texts) < len(chunk_ids):
+                        logger.warning(f"{len(chunk_ids) - len(texts)} feedback items not found")
+                    if not texts:
+                        continue
+                    
+                    analyzed = dict(zip(texts, analyzer.analyze_feedback_batch(list(texts.values()))))
+                    
+                    # Locked only for the write, so a concurrent re-analysis can't double
+                    # count the rollup or cluster counters; clusters first, then the rows.
+                    # Rows deleted meanwhile drop out
+                    await lock_clusters(session, {row.tenant_id for row in found})
+                    result = await session.execute(
+                        select(
+                            Feedback.id, Feedback.tenant_id,
+                            Feedback.created_at, Feedback.source, Feedback.channel,
+                            # Previous analysis, subtracted from the rollups on re-analysis
+                            Feedback.analyzed_at, Feedback.sentiment, Feedback.sentiment_score,
+                            Feedback.urgency_level, Feedback.is_feature_request, Feedback.is_bug_report
+                        ).where(Feedback.id.in_(list(texts))).with_for_update()
+                    )
+                    rows = result.all()
+                    if not rows:
+                        await session.rollback()
+                        continue
+                    
+                    analyses = [analyzed[row.id] for row in rows]
+                    values = [_analysis_values(analysis) for analysis in analyses]
+                    rollup = RollupDelta()
+                    for row, row_values in zip(rows, values):
+                        rollup.replace(row, analyzed_values(row), row_values)
+                    
+                    drifted = await _assign_to_clusters(session, [
+                        (row.tenant_id, row.id, row_values["embedding"], row_values["sentiment_score"])
+                        for row, row_values in zip(rows, values)
+                    ])
+                    
+                    # ORM bulk UPDATE by primary key
+                    await session.execute(
+                        update(Feedback),
+                        [{"id": row.id, **row_values} for row, row_values in zip(rows, values)]
+                    )
+                    await rollup.apply(session)
+                    await session.commit()
+                    
+                    _queue_refits(drifted)
+                    
+                    logger.info(f"Successfully analyzed {len(rows)} feedback items")
+                
+                except InferenceServerError as e:
+                    await session.rollback()
+                    raise self.retry(
+                        args=(feedback_ids[start:],),
+                        exc=e,
+                        countdown=_retry_countdown(self.request.retries)
+                    )
+                except Exception as e:
+                    logger.error(f"Error analyzing feedback batch starting at {chunk_ids[0]}: {str(e)}")
+                    await session.rollback()
+    
+    _run_async(_analyze_batch())
+
+
+@celery_app.task(name="recluster_tenant")
+def recluster_tenant_task(tenant_id: str, warm_start: bool = True):
+    """
+    Background task to fully re-cluster one tenant's feedback
+    """
+    async def _recluster():
+        async with AsyncSessionLocal() as session:
+            try:
+                await recluster_tenant(session, tenant_id, warm_start=warm_start)
+                await session.commit()
+                
+                # Clusters changed without new embeddings; drop the cached /run result
+                get_sync_redis().delete(clustering_cache_key(tenant_id))
+            except ValueError as e:
+                logger.info(f"Skipping clustering for tenant {tenant_id}: {str(e)}")
+            except Exception as e:
+                logger.error(f"Error clustering tenant {tenant_id}: {str(e)}")
+                await session.rollback()
+            finally:
+                get_sync_redis().delete(refit_lock_key(tenant_id))
+    
+    _run_async(_recluster())
+
+
+@celery_app.task(name="run_clustering", bind=True)
+def run_clustering_task(self, tenant_id: str, n_clusters: int = None, warm_start: bool = True, version: str = None):
+    """
+    Background task behind POST /clustering/run
+    
+    Reports progress through the task state and caches the result per
+    tenant under the embedding set version it was computed for.
+    """
+    def _progress(stage: str, fraction: float):
+        self.update_state(
+            state="PROGRESS",
+            meta={"tenant_id": tenant_id, "stage": stage, "progress": fraction}
+        )
+    
+    async def _run():
+        async with AsyncSessionLocal() as session:
+            try:
+                result = await recluster_tenant(
+                    session,
+                    tenant_id,
+                    n_clusters=n_clusters,
+                    warm_start=warm_start,
+                    progress=_progress
+                )
+                await session.commit()
+                return result
+            except Exception:
+                await session.rollback()
+                raise
+    
+    result = _run_async(_run())
+    
+    payload = {
+        "items_clustered": result["items_clustered"],
+        "clusters_created": int(result["n_clusters"]),
+        "clusters": result["clusters"]
+    }
+    
+    if version:
+        get_sync_redis().set(
+            clustering_cache_key(tenant_id),
+            json.dumps({
+                "version": version,
+                "params": {"n_clusters": n_clusters, "warm_start": warm_start},
+                "result": payload
+            }),
+            ex=settings.CLUSTERING_CACHE_TTL_SECONDS
+        )
+    
+    return {"tenant_id": tenant_id, **payload}
+
+
+@celery_app.task(name="recluster_all_tenants")
+def recluster_all_tenants_task():
+    """
+    Scheduled task to warm-start re-clustering for every clustered tenant
+    """
+    async def _tenants():
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(distinct(FeedbackCluster.tenant_id)))
+            return [str(tenant_id) for tenant_id in result.scalars()]
     
-    # Run async function
-    loop.run_until_complete(_analyze())
+    for tenant_id in _run_async(_tenants()):
+        recluster_tenant_task.delay(tenant_id)
 
 
 @celery_app.task(name="sync_integration")
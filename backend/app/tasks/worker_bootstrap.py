@@ -0,0 +1,66 @@
+"""
+Celery Worker Bootstrap
+Loads the analyzer models in the worker parent so prefork children share them copy-on-write
+
+Memory of the parent and each child, to check the sharing:
+
+    celery -A app.tasks.celery_app inspect memory
+"""
+
+from celery.signals import worker_init, worker_process_init
+from celery.worker.control import inspect_command
+import gc
+import logging
+
+from app.core.config import settings
+from app.core.process_memory import child_pids, process_memory
+
+logger = logging.getLogger(__name__)
+
+
+@worker_init.connect
+def preload_models(sender=None, **kwargs):
+    """Create the analyzer in the parent, before the pool forks its children"""
+    if not settings.CELERY_PRELOAD_MODELS or settings.INFERENCE_SERVER_SOCKET:
+        return  # Off, or the models live in the inference server
+    
+    pool = getattr(sender, "pool_cls", None)
+    forks = "prefork" in getattr(pool, "__module__", str(pool))
+    if forks and settings.INFERENCE_BACKEND == "onnx":
+        # ONNX Runtime sessions start their thread pools on creation and don't survive fork
+        logger.warning("Not preloading models: ONNX Runtime sessions can't be shared across fork")
+        return
+    
+    from app.services.ai_analyzer import get_ai_analyzer
+    
+    get_ai_analyzer()
+    
+    # Move everything loaded so far out of the collector's reach; GC passes in
+    # the children would otherwise write to the pages holding these objects
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Models preloaded in worker parent: {process_memory()}")
+
+
+@worker_process_init.connect
+def report_worker_memory(**kwargs):
+    """Log each pool child's memory as it starts"""
+    logger.info(f"Worker process started: {process_memory()}")
+
+
+@inspect_command()
+def memory(state, **kwargs):
+    """
+    Memory of the worker parent and its pool children
+    
+    With preloading the children's shared_mb holds the model weights and
+    total_pss_mb stays near one copy of the models plus per-child overhead.
+    """
+    parent = process_memory()
+    children = [process_memory(pid) for pid in child_pids()]
+    return {
+        "parent": parent,
+        "children": children,
+        "total_rss_mb": round(sum(usage.get("rss_mb", 0) for usage in [parent, *children]), 1),
+        "total_pss_mb": round(sum(usage.get("pss_mb", 0) for usage in [parent, *children]), 1),
+    }